@@ -0,0 +1,247 @@
+"""
+Offline benchmarks for the scriptsv2 hot paths.
+
+Every benchmark runs on deterministic synthetic price histories and trades,
+so no network access is needed. Results are written as JSON and compared
+against a stored baseline:
+
+    python benchmarks/bench.py                    # run and compare
+    python benchmarks/bench.py --update-baseline  # record a new baseline
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "scriptsv2"))
+
+import backtest_optimal_credit
+import db
+import populate_db
+import price_cache
+import stats
+import strategy
+from tradebook import TradeBook
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RESULTS = os.path.join(BENCH_DIR, "results.json")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+HISTORY_SIZES = [2500, 5000, 9000]
+TRADE_SIZES = [1000, 5000, 20000]
+QUICK_HISTORY_SIZES = [2500]
+QUICK_TRADE_SIZES = [1000]
+
+def synthetic_history(size, seed=0, end=None):
+    """Geometric random walk of `size` business days ending at `end`"""
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(end=end or datetime.now().date(), periods=size, name="Date")
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0004, 0.011, size)))
+    return pd.DataFrame({
+        "Close": close,
+        "High": close * 1.005,
+        "Low": close * 0.995,
+        "Open": close,
+        "Volume": rng.integers(1_000_000, 10_000_000, size),
+    }, index=index)
+
+def synthetic_trades(size, seed=0, win_rate=0.92):
+    rng = np.random.default_rng(seed)
+    start = datetime(2000, 1, 3).date()
+    return [
+        strategy.Trade(
+            ticker="SPY",
+            strategy_name="Trend Up",
+            current_price=400.0,
+            date_alerted=start + timedelta(days=i),
+            expiration_date=start + timedelta(days=i + 14),
+            option_type="put",
+            strike_price=390,
+            status="win" if rng.random() < win_rate else "loss",
+        )
+        for i in range(size)
+    ]
+
+def measure(function, repeat):
+    """Best wall time of `repeat` runs, output of the function silenced"""
+    best = float("inf")
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - start)
+    return best
+
+@contextlib.contextmanager
+def scratch_database(directory):
+    db.close_connection()
+    db.DB_NAME = os.path.join(directory, f"bench-{time.perf_counter_ns()}.db")
+    try:
+        yield
+    finally:
+        db.close_connection()
+        os.remove(db.DB_NAME)
+
+def bench_signals(size, repeat):
+    ticker_data = strategy.TickerData("SPY", history=synthetic_history(size))
+    end_date = datetime.now().date()
+    days = [end_date - timedelta(days=i) for i in range(min(size, 1000))]
+
+    def run_daily():
+        for day in days:
+            strategy.run_all_strategies(ticker_data, day, duplicate_filter=True)
+
+    return {
+        f"run_all_strategies_1000_days[{size}]": measure(run_daily, repeat),
+        f"scan_all_strategies[{size}]": measure(
+            lambda: strategy.scan_all_strategies(ticker_data, end_date - timedelta(days=size * 7 // 5), end_date),
+            repeat,
+        ),
+    }
+
+def bench_populate(size, repeat, directory):
+    os.environ["PRICE_CACHE_DIR"] = os.path.join(directory, f"prices-{size}")
+    os.environ["PRICE_CACHE_OFFLINE"] = "1"
+    for seed, ticker in enumerate(["IWM", "VTI", "QQQ", "SPY"]):
+        price_cache.write_cache(ticker, synthetic_history(size, seed))
+
+    def run():
+        with scratch_database(directory):
+            db.create_table()
+            populate_db.populate_historical_trades()
+
+    return {f"populate_historical_trades[{size}]": measure(run, repeat)}
+
+def bench_db(size, repeat, directory):
+    trades = synthetic_trades(size)
+
+    def save_one_by_one():
+        with scratch_database(directory):
+            for trade in trades:
+                db.save_trade_to_db(trade, trade.status)
+
+    def save_bulk():
+        with scratch_database(directory):
+            db.save_trades(trades)
+
+    results = {f"save_trades[{size}]": measure(save_bulk, repeat)}
+    # Committing every row is slow, keep the per-trade path on small sizes
+    if size <= 5000:
+        results[f"save_trade_to_db[{size}]"] = measure(save_one_by_one, repeat)
+    return results
+
+def bench_stats(size, repeat):
+    trades = TradeBook.from_trades(synthetic_trades(size))
+    outcomes = trades.is_status("win")
+    return {
+        f"calculate_statistics[{size}]": measure(lambda: stats.calculate_statistics(trades, 20000), repeat),
+        f"kelly_grid[{size}]": measure(
+            lambda: backtest_optimal_credit.evaluate_grid(
+                outcomes,
+                np.arange(90, 92, 0.5),
+                np.arange(0.30, 0.55, 0.05),
+                np.arange(0.3, 0.85, 0.05),
+            ),
+            repeat,
+        ),
+    }
+
+def run_benchmarks(history_sizes, trade_sizes, repeat):
+    directory = tempfile.mkdtemp(prefix="credit-spread-bench-")
+    environment = {key: os.environ.get(key) for key in ("PRICE_CACHE_DIR", "PRICE_CACHE_OFFLINE")}
+    db_name = db.DB_NAME
+    results = {}
+    try:
+        for size in history_sizes:
+            results.update(bench_signals(size, repeat))
+            results.update(bench_populate(size, repeat, directory))
+        for size in trade_sizes:
+            results.update(bench_db(size, repeat, directory))
+            results.update(bench_stats(size, repeat))
+    finally:
+        db.DB_NAME = db_name
+        for key, value in environment.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+def compare(results, baseline, threshold, min_delta):
+    """Benchmarks slower than threshold x baseline by more than min_delta seconds"""
+    regressions = {}
+    for name, seconds in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if seconds > reference * threshold and seconds - reference > min_delta:
+            regressions[name] = (reference, seconds)
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the trading scripts")
+    parser.add_argument("--output", default=DEFAULT_RESULTS, help="Where to write the results JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=1.5,
+                        help="Fail when a benchmark is this many times slower than the baseline")
+    parser.add_argument("--min-delta", type=float, default=0.005,
+                        help="Ignore slowdowns smaller than this many seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark, the best one is kept")
+    parser.add_argument("--quick", action="store_true", help="Only run the smallest data sizes")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    history_sizes = QUICK_HISTORY_SIZES if args.quick else HISTORY_SIZES
+    trade_sizes = QUICK_TRADE_SIZES if args.quick else TRADE_SIZES
+
+    results = run_benchmarks(history_sizes, trade_sizes, args.repeat)
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    for name, seconds in results.items():
+        print(f"{name:<45} {seconds * 1000:>10.2f} ms")
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against, run with --update-baseline to record one")
+        return
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)["results"]
+    regressions = compare(results, baseline, args.threshold, args.min_delta)
+    for name, (reference, seconds) in regressions.items():
+        print(f"REGRESSION {name}: {reference * 1000:.2f} ms -> {seconds * 1000:.2f} ms")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions beyond {args.threshold}x the baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Startup time budgets for the scriptsv2/main.py subcommands.
+
+main.py imports the modules of an action only when it runs. For every
+subcommand this imports main plus those modules in a fresh interpreter
+with -X importtime, and fails when the import time exceeds the budget or
+when a light subcommand loads a heavy dependency:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --repeat 5 stats help
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(ROOT, "scriptsv2")
+
+HEAVY_MODULES = ("pandas", "yfinance", "dotenv")
+
+# subcommand: (modules its action imports, import budget in seconds, modules it must not load),
+# "help" stands for main.py --help
+SUBCOMMANDS = {
+    "help": ((), 0.15, HEAVY_MODULES),
+    "stats": (("stats",), 0.3, HEAVY_MODULES),
+    "montecarlo": (("montecarlo",), 0.3, HEAVY_MODULES),
+    "run": (("strategy",), 2.0, ("yfinance",)),
+    "backtest": (("db", "populate_db", "stats"), 2.0, ("yfinance",)),
+    "daemon": (("daemon",), 2.0, ("yfinance",)),
+}
+
+def import_profile(modules):
+    """(seconds, top-level package names) of importing main and modules in a new interpreter"""
+    statement = "import " + ", ".join(("main", *modules))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=SCRIPTS_DIR, capture_output=True, text=True, check=True,
+    )
+    total = 0
+    loaded = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        loaded.add(name.strip().split(".")[0])
+        # Nested imports are indented, their time is already in their parent's
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+    return total / 1e6, loaded
+
+def check_startup(subcommands, repeat=3):
+    """Print every subcommand's import time, returns the failures"""
+    failures = []
+    print(f"{'Subcommand':<12} {'Import ms':>10} {'Budget ms':>10}")
+    for subcommand in subcommands:
+        modules, budget, forbidden = SUBCOMMANDS[subcommand]
+        # The fastest run is the least disturbed by the rest of the machine
+        runs = [import_profile(modules) for _ in range(repeat)]
+        seconds = min(run[0] for run in runs)
+        print(f"{subcommand:<12} {seconds * 1000:>10.1f} {budget * 1000:>10.0f}")
+
+        if seconds > budget:
+            failures.append(f"{subcommand}: {seconds * 1000:.0f}ms over its {budget * 1000:.0f}ms budget")
+        heavy = sorted(set(forbidden) & runs[0][1])
+        if heavy:
+            failures.append(f"{subcommand}: imports {', '.join(heavy)}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of every main.py subcommand")
+    parser.add_argument("subcommands", nargs="*", metavar="SUBCOMMAND",
+                        help=f"Subcommands to check: {', '.join(SUBCOMMANDS)} (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="Imports per subcommand, the fastest counts")
+    args = parser.parse_args()
+    unknown = set(args.subcommands) - set(SUBCOMMANDS)
+    if unknown:
+        parser.error(f"unknown subcommands: {', '.join(sorted(unknown))}")
+
+    failures = check_startup(args.subcommands or list(SUBCOMMANDS), args.repeat)
+    if failures:
+        raise SystemExit("Startup budget exceeded:\n" + "\n".join(failures))
+    print("All subcommands within their startup budget")
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,15 @@
 import time
 from datetime import datetime, timedelta
+from functools import partial
 
 import numpy as np
-import yfinance as yf
-from strategy import (
-    Strategy,
-    TickerData,
-    Trade,
-    run_all_strategies,
-    run_each_strategy,
-    strategies,
-)
-import math
+from strategy import Strategy, TickerData, Trade, run_all_strategies, scan_strategy
+from sweep import run_sweep
+from trade_file import load_trades, write_trade_file
+from wheel import simulate_wheel
 
 def write_trades_to_file(daily_trades, output_file):
+    # Human readable export, backtests read the binary files of trade_file
     trade_data_list = []
     with open(output_file, "w") as file:
         for daily_trade in daily_trades:
@@ -97,19 +93,27 @@ def process_trades(file_name):
     return output
 
 
+def parse_trade_date(value):
+    # Trades read back from a file carry their dates as strings
+    if isinstance(value, str):
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    return value
+
+
 def backtest_strategy(ticker_data, trades, verbose=False):
     money = 0
     win = 0
     total = 0
     price_multiplier = []
+    failed_puts = []
 
     if trades is None:
         return
 
     for trade in trades:
 
-        expiration_date = datetime.strptime(trade.expiration_date, "%Y-%m-%d %H:%M:%S")
-        date_alerted = datetime.strptime(trade.date_alerted, "%Y-%m-%d %H:%M:%S")
+        expiration_date = parse_trade_date(trade.expiration_date)
+        date_alerted = parse_trade_date(trade.date_alerted)
         sell_strike = float(trade.strike_prices)
         option_type = trade.option_type
 
@@ -129,13 +133,8 @@ def backtest_strategy(ticker_data, trades, verbose=False):
             if alerted_price is None:
                 continue
 
+            # Expirations are trading sessions, see trading_calendar
             expiration_price = ticker_data.get_date_price(expiration_date)
-            i = 0
-            while expiration_price is None and i < 5:  # Try up to 5 days back
-                expiration_price = ticker_data.get_date_price(
-                    expiration_date - timedelta(days=i)
-                )
-                i += 1
 
             if expiration_price is None:
                 continue  # Skip this trade if we can't find a valid expiration price
@@ -159,51 +158,29 @@ def backtest_strategy(ticker_data, trades, verbose=False):
                         f"{alerted_price:.2f} - {option_type} {expiration_date.strftime('%d %B %Y')} {sell_strike:.2f} - {expiration_price:.2f} - FAILED"
                     )
 
-                # Implement wheel strategy for failed puts
+                # Failed puts are rolled into the wheel strategy below
                 if option_type == "put":
-                    days_to_profit = 0
-                    current_date = expiration_date
-                    cost_basis = sell_strike
-                    total_credit = float(trade.min_credit)
-                    borrowed_shares_cost = 0
-
-                    while True:
-                        days_to_profit += 7  # Assume weekly options
-                        current_date += timedelta(days=7)
-                        
-                        # Ensure we find a valid price
-                        current_price = None
-                        for i in range(5):  # Try up to 5 days forward
-                            temp_date = current_date + timedelta(days=i)
-                            current_price = ticker_data.get_date_price(temp_date)
-                            if current_price is not None:
-                                current_date = temp_date
-                                break
-
-                        if current_price is None:
-                            break  # End of available data
-
-                        # Calculate borrowing fee for the week
-                        borrowing_fee = (cost_basis * 100 * 0.06 * 7) / 365  # 6% per year
-                        borrowed_shares_cost += borrowing_fee
-
-                        # Sell a call at strike price + 1
-                        call_strike = math.ceil(cost_basis) + 5
-                        call_credit = 50  # Fixed credit amount, you may want to make this dynamic
-                        total_credit += call_credit
-
-                        if current_price >= call_strike:
-                            # Call is assigned, exit the position
-                            profit = (call_strike - cost_basis) * 100 + total_credit - borrowed_shares_cost
-                            money += profit
-                            if verbose:
-                                print(f"Wheel strategy: {days_to_profit} days to profit. Total profit: ${profit:.2f}")
-                                print(f"Borrowed shares cost: ${borrowed_shares_cost:.2f}")
-                            break
-
-                    if current_price is None and verbose:
-                        print(f"Wheel strategy: Position not closed due to lack of data. Days held: {days_to_profit}")
-                        print(f"Borrowed shares cost: ${borrowed_shares_cost:.2f}")
+                    failed_puts.append(
+                        (expiration_date, sell_strike, float(trade.min_credit))
+                    )
+
+    if failed_puts:
+        expiration_dates, cost_bases, credits = zip(*failed_puts)
+        wheel = simulate_wheel(ticker_data, expiration_dates, cost_bases, credits)
+        money += float(wheel["profit"].sum())
+
+        if verbose:
+            for closed, days_held, profit, borrowed_cost in zip(
+                wheel["closed"],
+                wheel["days_held"],
+                wheel["profit"],
+                wheel["borrowed_cost"],
+            ):
+                if closed:
+                    print(f"Wheel strategy: {days_held} days to profit. Total profit: ${profit:.2f}")
+                else:
+                    print(f"Wheel strategy: Position not closed due to lack of data. Days held: {days_held}")
+                print(f"Borrowed shares cost: ${borrowed_cost:.2f}")
 
     if verbose:
         print("money: ", money)
@@ -217,6 +194,19 @@ def backtest_strategy(ticker_data, trades, verbose=False):
         return 0, 0, 0
 
     return win / total * 100, win, total
+
+
+def evaluate_strategy(ticker_data, strategy, specific_date, days=7000):
+    trades = scan_strategy(
+        ticker_data, strategy, specific_date - timedelta(days=days - 1), specific_date
+    )
+    if len(trades) == 0:
+        return {"win_rate": 0, "win": 0, "total": 0}
+
+    win_rate, win, total = backtest_strategy(ticker_data, trades)
+    return {"win_rate": win_rate, "win": win, "total": total}
+
+
 def backtrack_strategy():
     # Define ranges
     down_range = [-5, 5]
@@ -244,11 +234,11 @@ def backtrack_strategy():
 
     return strategies_backtest
 
-def main_backtest(type):
+def main_backtest(type, export_text=False):
     var = 0
     options = ["VTI", "QQQ"]
 
-    file_name = f"{options[var]}.txt"
+    file_name = f"{options[var]}.trades"
     specific_date = datetime(2024, 10, 17)
 
     ticker_symbol = options[var]
@@ -261,53 +251,30 @@ def main_backtest(type):
                 run_all_strategies(ticker_data, specific_date - timedelta(days=i))
             )
         all_trades = [item for item in all_trades if item != []]
-        write_trades_to_file(all_trades, file_name)
+        write_trade_file(
+            (trade for daily_trade in all_trades for trade in daily_trade), file_name
+        )
+        if export_text:
+            write_trades_to_file(all_trades, f"{options[var]}.txt")
         # elif type == "verify":
-        trades = read_trades_from_file(file_name)
+        trades = load_trades(file_name)
         backtest_strategy(ticker_data, trades, verbose=True)
     elif type == "each_strategy":
         strategy_results = []
         generated_strategies = backtrack_strategy()
 
-        strategy_num = 0
+        evaluate = partial(evaluate_strategy, specific_date=specific_date, days=7000)
 
-        for strategy in generated_strategies:
-            start_time = time.time()
-            strategy_num += 1
-
-            trades = []
-
-            for i in range(0, 7000):
-                trades.append(
-                    run_each_strategy(
-                        ticker_data, specific_date - timedelta(days=i), strategy
-                    )
-                )
-            trades = [item for item in trades if item != []]
-
-            if len(trades) == 0:
-                strategy_results.append(
-                    {"strategy": strategy, "win_rate": 0, "win": 0, "total": 0}
-                )
-                continue
-
-            parsed_trades = []
-
-            for daily_trade in trades:
-                for trade in daily_trade:
-                    parsed_trades.append(trade)
-
-            # write_trades_to_file(trades, file_name)
-            #
-            # trades = read_trades_from_file(file_name)
-            win_rate, win, total = backtest_strategy(ticker_data, parsed_trades)
-            strategy_results.append(
-                {"strategy": strategy, "win_rate": win_rate, "win": win, "total": total}
-            )
+        start_time = time.time()
+        for strategy_num, (strategy, result) in enumerate(
+            run_sweep(ticker_data, generated_strategies, evaluate), 1
+        ):
+            strategy_results.append({"strategy": strategy, **result})
 
-            end_time = time.time()
+            # Results arrive as the pool finishes them, so time the whole sweep
             print(
-                f"{options[var]} -- {strategy_num}/{len(generated_strategies)} -- {end_time - start_time}"
+                f"{options[var]} -- {strategy_num}/{len(generated_strategies)} -- "
+                f"total {time.time() - start_time:.1f}s"
             )
 
             if strategy_num % 100 == 0:
@@ -0,0 +1,117 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# One .npz file per ticker: a "Date" column plus one array per OHLCV column
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "data", "prices"
+)
+
+
+def get_cache_dir():
+    return os.environ.get("PRICE_CACHE_DIR") or DEFAULT_CACHE_DIR
+
+
+def is_offline():
+    return os.environ.get("PRICE_CACHE_OFFLINE", "").lower() in ("1", "true", "yes")
+
+
+def cache_path(ticker, cache_dir=None):
+    return os.path.join(cache_dir or get_cache_dir(), f"{ticker}.npz")
+
+
+def read_cache(ticker, cache_dir=None):
+    path = cache_path(ticker, cache_dir)
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path) as data:
+        index = pd.DatetimeIndex(data["Date"].astype("datetime64[ns]"), name="Date")
+        columns = {name: data[name] for name in data.files if name != "Date"}
+    return pd.DataFrame(columns, index=index)
+
+
+def write_cache(ticker, history, cache_dir=None):
+    path = cache_path(ticker, cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    columns = {str(name): history[name].to_numpy() for name in history.columns}
+    # Write to a temporary file first so an interrupted run never leaves a truncated cache
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        np.savez(file, Date=history.index.values.astype("datetime64[D]"), **columns)
+    os.replace(temp_path, path)
+
+
+def download_history(ticker, start=None):
+    import yfinance as yf
+
+    if start is None:
+        history = yf.download(ticker)
+    else:
+        history = yf.download(ticker, start=start)
+    if isinstance(history.columns, pd.MultiIndex):
+        history.columns = history.columns.get_level_values(0)
+    history.columns.name = None
+    history.index = history.index.tz_localize(None)
+    return history
+
+
+def reload_history(ticker, cache_dir=None):
+    """Download the whole history again and replace the cached copy"""
+    history = download_history(ticker)
+    if not history.empty:
+        write_cache(ticker, history, cache_dir)
+    return history
+
+
+def same_basis(history, new_bars, rtol=1e-6):
+    """
+    False when a freshly fetched bar differs from the copy held in history.
+    yfinance adjusts the whole series for every dividend or split, so new
+    bars can only be appended to a history adjusted on the same basis. The
+    last bar held is not compared since it may have been saved intraday.
+    """
+    dates = new_bars.index.intersection(history.index[:-1])
+    if dates.empty:
+        return True
+    held = history.loc[dates, "Close"].to_numpy(dtype=float)
+    fresh = new_bars.loc[dates, "Close"].to_numpy(dtype=float)
+    return bool(np.allclose(held, fresh, rtol=rtol, atol=0, equal_nan=True))
+
+
+def load_history(ticker, offline=None, cache_dir=None):
+    """
+    Return the full daily history for ticker, downloading only the bars
+    that are missing from the local cache. In offline mode the cache is
+    the only source.
+    """
+    if offline is None:
+        offline = is_offline()
+
+    cached = read_cache(ticker, cache_dir)
+    if offline:
+        if cached is None:
+            raise FileNotFoundError(
+                f"No cached price history for {ticker} at {cache_path(ticker, cache_dir)}"
+            )
+        return cached
+
+    if cached is None or cached.empty:
+        return reload_history(ticker, cache_dir)
+
+    # Fetch from the last complete cached bar, to compare it with a fresh copy.
+    # The last cached bar is fetched again since it may have been saved intraday
+    start = cached.index[-2] if len(cached) > 1 else cached.index[-1]
+    new_bars = download_history(ticker, start=start.strftime("%Y-%m-%d"))
+    if new_bars.empty:
+        return cached
+    if not same_basis(cached, new_bars):
+        # Adjusted for a dividend or split since the cache was written
+        return reload_history(ticker, cache_dir)
+
+    new_bars = new_bars.reindex(columns=cached.columns)
+    history = pd.concat([cached[cached.index < new_bars.index[0]], new_bars])
+    write_cache(ticker, history, cache_dir)
+    return history
@@ -2,12 +2,15 @@ import math
 import os
 from datetime import datetime, timedelta
 
-import telebot
-import yfinance as yf
+import numpy as np
+import pandas as pd
 from dotenv import load_dotenv
+from notifier import get_notifier
+from price_cache import load_history
 from sqlalchemy import Column, Date, Float, Integer, String, create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from trading_calendar import expiration_session, expiration_sessions
 
 load_dotenv()
 environment = os.environ.get("ENV")
@@ -75,27 +78,95 @@ strategies = [
 
 
 class TickerData:
-    def __init__(self, ticker):
+    def __init__(self, ticker, history=None):
         self.ticker = ticker
-        self.ticker_data = yf.download(ticker)
+        self.ticker_data = load_history(ticker) if history is None else history
+        self.calculate_indicators()
+
+    def calculate_indicators(self, window=200):
+        # Rolling windows only look backwards, so the value at each row equals
+        # the one obtained by slicing the history up to that date.
+        close = self.ticker_data["Close"]
+        if isinstance(close, pd.DataFrame):
+            close = close.iloc[:, 0]
+        rolling_data = close.rolling(window=window)
+        self.set_indicators(
+            pd.DataFrame(
+                {
+                    "Close": close,
+                    "MA": rolling_data.mean(),
+                    "STD": rolling_data.std(),
+                }
+            )
+        )
+
+    @classmethod
+    def from_arrays(cls, ticker, dates, close, ma, std):
+        """Rebuild a TickerData from precomputed arrays, without downloading"""
+        indicators = pd.DataFrame(
+            {"Close": close, "MA": ma, "STD": std},
+            index=pd.DatetimeIndex(np.asarray(dates).astype("datetime64[ns]")),
+        )
+        ticker_data = cls.__new__(cls)
+        ticker_data.ticker = ticker
+        ticker_data.ticker_data = indicators[["Close"]]
+        ticker_data.set_indicators(indicators)
+        return ticker_data
+
+    def set_indicators(self, indicators):
+        self.indicators = indicators
+        self.dates = self.indicators.index.values.astype("datetime64[D]")
+        self.close = self.indicators["Close"].to_numpy(dtype=float)
+        self.ma = self.indicators["MA"].to_numpy(dtype=float)
+        self.std = self.indicators["STD"].to_numpy(dtype=float)
+
+    def find_sessions(self, dates, direction="backward", max_days=None):
+        """
+        Index of the trading day on or before ("backward") or on or after
+        ("forward") each date, -1 where there is none within max_days.
+        """
+        days = np.asarray(dates, dtype="datetime64[D]")
+        if direction == "backward":
+            positions = np.searchsorted(self.dates, days, side="right") - 1
+        else:
+            positions = np.searchsorted(self.dates, days, side="left")
+
+        found = (positions >= 0) & (positions < len(self.dates))
+        if max_days is not None:
+            sessions = self.dates[np.clip(positions, 0, len(self.dates) - 1)]
+            found &= abs(sessions - days) <= np.timedelta64(max_days, "D")
+        return np.where(found, positions, -1)
+
+    def get_prices_asof(self, dates, direction="backward", max_days=None):
+        """Batch version of get_price_on_or_before/after, NaN where no session qualifies"""
+        positions = self.find_sessions(dates, direction, max_days)
+        return np.where(positions >= 0, self.close[positions], np.nan)
+
+    def _session_price(self, date, direction, max_days):
+        position = self.find_sessions(date, direction, max_days)
+        if position < 0:
+            return None, None
+        return self.dates[position].astype(object), float(self.close[position])
+
+    def get_price_on_or_before(self, date, max_days=None):
+        """(session date, close) of the last trading day on or before date"""
+        return self._session_price(date, "backward", max_days)
+
+    def get_price_on_or_after(self, date, max_days=None):
+        """(session date, close) of the first trading day on or after date"""
+        return self._session_price(date, "forward", max_days)
 
     def get_last_price(self):
-        return self.ticker_data["Close"][-1]
+        return float(self.close[-1])
 
     def get_date_price(self, date):
-        try:
-            return self.ticker_data.loc[date.strftime("%Y-%m-%d")]["Close"]
-        except KeyError:
-            return None
+        return self._session_price(date, "backward", 0)[1]
 
     def calculate_ma_std(self, date):
-        try:
-            rolling_data = self.ticker_data["Close"].loc[:date].rolling(window=200)
-            ma = rolling_data.mean().iloc[-1]
-            std = rolling_data.std().iloc[-1]
-            return ma, std
-        except (KeyError, IndexError):
+        position = self.find_sessions(date)
+        if position < 0:
             return None, None
+        return self.ma[position], self.std[position]
 
 
 class Trade():
@@ -169,11 +240,10 @@ def check_strategy(ticker, specific_date, strategy):
 
         if lower_boundary <= current_price <= upper_boundary:
             strike_price = current_price * strategy.price_multiplier
-            expiration_date = date_alerted + timedelta(
-                days=strategy.expiration_date_round
+            # Next Friday, or the session before it on exchange holidays
+            expiration_date = expiration_session(
+                date_alerted, strategy.expiration_date_round
             )
-            while expiration_date.weekday() != 4:  # 4 represents Friday
-                expiration_date += timedelta(days=1)
 
             trade = Trade(
                 ticker=ticker.ticker,
@@ -197,6 +267,63 @@ def calculate_credit(win_rate):
     return math.ceil(55 - 0.5 * win_rate + 1)
 
 
+def scan_strategy(ticker_data, strategy, start_date, end_date):
+    """
+    Whole-history equivalent of calling run_each_strategy for every calendar
+    day from start_date to end_date.
+    """
+    dates = ticker_data.dates
+    close = ticker_data.close
+    weekdays = (dates.astype("int64") + 3) % 7  # 1970-01-01 was a Thursday
+
+    upper_boundary = ticker_data.ma + strategy.deviation["up"] * ticker_data.std
+    lower_boundary = ticker_data.ma + strategy.deviation["down"] * ticker_data.std
+    alerts = np.flatnonzero(
+        (weekdays < 5) & (lower_boundary <= close) & (close <= upper_boundary)
+    )
+
+    alert_dates = dates[alerts]
+    strikes = (close[alerts] * strategy.price_multiplier).astype(int)
+
+    expiration_dates = expiration_sessions(
+        alert_dates, strategy.expiration_date_round
+    )
+
+    # remove_duplicates keeps an alert unless the previous alert inside the
+    # 5-day lookback shares its expiration and sits within $20 of its strike
+    keep = np.ones(len(alerts), dtype=bool)
+    keep[1:] = (
+        (np.diff(alert_dates).astype("int64") > 4)
+        | (expiration_dates[1:] != expiration_dates[:-1])
+        | (np.abs(np.diff(strikes)) > 20)
+    )
+    keep &= (alert_dates >= np.datetime64(start_date, "D")) & (
+        alert_dates <= np.datetime64(end_date, "D")
+    )
+
+    win_rate = strategy.win_rate[ticker_data.ticker]
+    return [
+        Trade(
+            ticker=ticker_data.ticker,
+            strategy_name=f"{strategy.name}",
+            win_rate=win_rate,
+            current_price=int(close[position]),
+            ma_std=f"{ticker_data.ma[position]}/{ticker_data.std[position]}",
+            date_alerted=date_alerted,
+            expiration_date=expiration_date,
+            option_type=strategy.option_type,
+            strike_prices=int(strike),
+            min_credit=calculate_credit(win_rate),
+        )
+        for position, date_alerted, expiration_date, strike in zip(
+            alerts[keep],
+            alert_dates[keep].astype("datetime64[s]").tolist(),
+            expiration_dates[keep].astype("datetime64[s]").tolist(),
+            strikes[keep],
+        )
+    ]
+
+
 def remove_duplicates(trades, date_limit):
     oldest_trade = None
     for trade in trades:
@@ -263,8 +390,8 @@ def generate_notifications(trades):
     print(output)
 
     if output and environment == "PROD":
-        bot = telebot.TeleBot(os.environ.get("TELEGRAM_TOKEN"))
-        bot.send_message(os.environ.get("TELEGRAM_CHAT_ID"), output)
+        # Sent in the background by main, coalesced with the other tickers' notifications
+        get_notifier().send(output)
 
 
 def main():
@@ -284,6 +411,9 @@ def main():
         trades = run_all_strategies(ticker, specific_date, duplicate_filter=False)
         generate_notifications(trades)
 
+    if environment == "PROD":
+        get_notifier().flush()
+
 
 if __name__ == "__main__":
     main()
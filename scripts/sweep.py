@@ -0,0 +1,78 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from strategy import TickerData
+
+# Set once per worker process by _init_worker
+_worker_memory = None
+_worker_ticker_data = None
+
+
+def _attach(name):
+    try:
+        # Python 3.13+: only the creating process should track the segment
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _init_worker(ticker, memory_name, shape):
+    global _worker_memory, _worker_ticker_data
+
+    _worker_memory = _attach(memory_name)
+    columns = np.ndarray(shape, dtype=np.float64, buffer=_worker_memory.buf)
+    _worker_ticker_data = TickerData.from_arrays(
+        ticker,
+        columns[0].astype("int64").astype("datetime64[D]"),
+        columns[1],
+        columns[2],
+        columns[3],
+    )
+
+
+def _run_task(evaluate, index, strategy):
+    return index, evaluate(_worker_ticker_data, strategy)
+
+
+def run_sweep(ticker_data, strategies, evaluate, workers=None):
+    """
+    Evaluate every strategy against ticker_data on a process pool and yield
+    (strategy, result) pairs as soon as each evaluation finishes.
+
+    evaluate(ticker_data, strategy) must be a picklable module level callable.
+    The price and indicator arrays are copied once into shared memory and
+    every worker rebuilds its TickerData from them, so only the strategy
+    travels with each task.
+    """
+    columns = np.vstack(
+        [
+            ticker_data.dates.astype("int64").astype(np.float64),
+            ticker_data.close,
+            ticker_data.ma,
+            ticker_data.std,
+        ]
+    )
+    memory = shared_memory.SharedMemory(create=True, size=columns.nbytes)
+    try:
+        shared = np.ndarray(columns.shape, dtype=np.float64, buffer=memory.buf)
+        shared[:] = columns
+        del shared
+
+        with ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            initializer=_init_worker,
+            initargs=(ticker_data.ticker, memory.name, columns.shape),
+        ) as executor:
+            futures = [
+                executor.submit(_run_task, evaluate, index, strategy)
+                for index, strategy in enumerate(strategies)
+            ]
+            for future in as_completed(futures):
+                index, result = future.result()
+                yield strategies[index], result
+    finally:
+        memory.close()
+        memory.unlink()
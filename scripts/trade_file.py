@@ -0,0 +1,153 @@
+"""
+Binary columnar trade file.
+
+Layout: the 8-byte magic, a little-endian uint32 format version and uint32
+header length, a JSON header, then every column as a raw little-endian
+array starting on an 8-byte boundary. The header lists the number of
+trades and, for each column, its dtype, byte offset and, for string
+columns, the categories its int32 codes refer to. Files are memory-mapped
+on read, so the columns are views of the page cache rather than copies.
+"""
+import json
+import os
+import struct
+
+import numpy as np
+from strategy import Trade
+
+MAGIC = b"CSTRADES"
+VERSION = 1
+PREAMBLE = struct.Struct("<8sII")
+ALIGNMENT = 8
+
+CATEGORICAL = ("ticker", "strategy_name", "option_type")
+DATES = ("date_alerted", "expiration_date")
+NUMERIC = ("current_price", "strike_prices", "min_credit", "win_rate", "ma", "std")
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _data_start(header_length):
+    # Column offsets in the header are relative to the first aligned byte after it
+    return _aligned(PREAMBLE.size + header_length)
+
+
+def _numeric(values):
+    column = np.asarray(values)
+    # Keep whole numbers as integers so they read back exactly as written
+    if column.dtype.kind not in "iu":
+        column = column.astype(np.float64)
+    return column.astype(column.dtype.newbyteorder("<"))
+
+
+def trades_to_columns(trades):
+    """Column arrays of a list of Trade objects, plus the categories of each string column"""
+    columns = {}
+    categories = {}
+    for name in CATEGORICAL:
+        values = [getattr(trade, name) for trade in trades]
+        categories[name], codes = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+        categories[name] = categories[name].tolist()
+        columns[name] = codes.astype("<i4")
+    for name in DATES:
+        columns[name] = np.array(
+            [getattr(trade, name) for trade in trades], dtype="datetime64[s]"
+        ).astype("<M8[s]")
+
+    # ma_std is stored as its two numbers, "ma/std" is rebuilt on load
+    ma_std = [str(trade.ma_std).split("/") for trade in trades]
+    values = {
+        "current_price": [trade.current_price for trade in trades],
+        "strike_prices": [trade.strike_prices for trade in trades],
+        "min_credit": [trade.min_credit for trade in trades],
+        "win_rate": [trade.win_rate for trade in trades],
+        "ma": [float(ma) for ma, _ in ma_std],
+        "std": [float(std) for _, std in ma_std],
+    }
+    for name in NUMERIC:
+        columns[name] = _numeric(values[name])
+    return columns, categories
+
+
+def write_trade_file(trades, file_name):
+    trades = list(trades)
+    columns, categories = trades_to_columns(trades)
+
+    header = {"count": len(trades), "columns": []}
+    offset = 0
+    for name, column in columns.items():
+        offset = _aligned(offset)
+        entry = {"name": name, "dtype": column.dtype.str, "offset": offset}
+        if name in categories:
+            entry["categories"] = categories[name]
+        header["columns"].append(entry)
+        offset += column.nbytes
+
+    header_bytes = json.dumps(header).encode()
+    data_start = _data_start(len(header_bytes))
+
+    # Write to a temporary file first so an interrupted run never leaves a truncated file
+    temp_name = file_name + ".tmp"
+    with open(temp_name, "wb") as file:
+        file.write(PREAMBLE.pack(MAGIC, VERSION, len(header_bytes)))
+        file.write(header_bytes)
+        for entry, column in zip(header["columns"], columns.values()):
+            file.write(b"\0" * (data_start + entry["offset"] - file.tell()))
+            file.write(column.tobytes())
+    os.replace(temp_name, file_name)
+
+
+def read_trade_file(file_name):
+    """
+    Memory-map a trade file. Returns (count, columns, categories), where the
+    columns are read-only arrays backed by the mapping.
+    """
+    data = np.memmap(file_name, dtype=np.uint8, mode="r")
+    magic, version, header_length = PREAMBLE.unpack(bytes(data[: PREAMBLE.size]))
+    if magic != MAGIC:
+        raise ValueError(f"{file_name} is not a trade file")
+    if version != VERSION:
+        raise ValueError(f"{file_name} has trade file version {version}, expected {VERSION}")
+
+    header = json.loads(bytes(data[PREAMBLE.size : PREAMBLE.size + header_length]))
+    data_start = _data_start(header_length)
+    count = header["count"]
+
+    columns = {}
+    categories = {}
+    for entry in header["columns"]:
+        dtype = np.dtype(entry["dtype"])
+        start = data_start + entry["offset"]
+        columns[entry["name"]] = data[start : start + count * dtype.itemsize].view(dtype)
+        if "categories" in entry:
+            categories[entry["name"]] = entry["categories"]
+    return count, columns, categories
+
+
+def load_trades(file_name):
+    """Trade objects of a trade file, with datetime dates and numeric fields"""
+    count, columns, categories = read_trade_file(file_name)
+    values = {name: column.tolist() for name, column in columns.items()}
+    for name in CATEGORICAL:
+        labels = categories[name]
+        values[name] = [labels[code] for code in values[name]]
+    for name in DATES:
+        values[name] = columns[name].astype(object).tolist()
+
+    return [
+        Trade(
+            ticker=values["ticker"][i],
+            strategy_name=values["strategy_name"][i],
+            current_price=values["current_price"][i],
+            ma_std=f"{values['ma'][i]}/{values['std'][i]}",
+            date_alerted=values["date_alerted"][i],
+            expiration_date=values["expiration_date"][i],
+            option_type=values["option_type"][i],
+            strike_prices=values["strike_prices"][i],
+            min_credit=values["min_credit"][i],
+            win_rate=values["win_rate"][i],
+        )
+        for i in range(count)
+    ]
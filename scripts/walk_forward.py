@@ -0,0 +1,194 @@
+"""
+Walk-forward optimization of the backtest strategy grid.
+
+Each strategy is scanned and settled once over the whole history, on the
+process pool of run_sweep. Prefix sums of its wins and settled trades then
+give the result of any date window in O(1), so choosing the best strategy
+on every train window and scoring it on the following test window costs
+little more than the single sweep.
+
+A train window only counts the trades that expired before its test window
+starts, so the choice never uses an outcome that was unknown at the time.
+Test windows count the trades alerted in them.
+"""
+from datetime import datetime, timedelta
+from functools import partial
+
+import numpy as np
+from backtest import backtrack_strategy
+from strategy import TickerData, scan_strategy
+from sweep import run_sweep
+
+
+def strategy_outcomes(ticker_data, strategy, start_date, end_date):
+    """
+    Alert dates, expiration dates and outcomes of the trades
+    backtest_strategy would count for strategy between start_date and
+    end_date, in alert order.
+    """
+    trades = scan_strategy(ticker_data, strategy, start_date, end_date)
+    trades = [trade for trade in trades if trade.expiration_date <= datetime.now()]
+    if not trades:
+        empty = np.empty(0, dtype="datetime64[D]")
+        return empty, empty, np.empty(0, dtype=bool)
+
+    alert_dates = np.array([trade.date_alerted for trade in trades], dtype="datetime64[D]")
+    expiration_dates = np.array(
+        [trade.expiration_date for trade in trades], dtype="datetime64[D]"
+    )
+    sell_strikes = np.array([float(trade.strike_prices) for trade in trades])
+    # Close on the expiration session, as in backtest_strategy
+    expiration_prices = ticker_data.get_prices_asof(
+        [trade.expiration_date for trade in trades], max_days=0
+    )
+
+    settled = ~np.isnan(expiration_prices)
+    if strategy.option_type == "put":
+        wins = sell_strikes < expiration_prices
+    else:
+        wins = sell_strikes > expiration_prices
+    return alert_dates[settled], expiration_dates[settled], wins[settled]
+
+
+def counts_before(dates, wins, boundaries):
+    """(wins, trades) among the trades dated before each boundary, dates sorted"""
+    positions = np.searchsorted(dates, boundaries, side="left")
+    return np.concatenate(([0], np.cumsum(wins)))[positions], positions
+
+
+def window_edges(start_date, end_date, train_days, test_days):
+    """(train_start, test_start, test_end) dates, the test windows tile the history"""
+    edges = []
+    train_start = start_date
+    while train_start + timedelta(days=train_days + test_days) <= end_date + timedelta(days=1):
+        test_start = train_start + timedelta(days=train_days)
+        edges.append((train_start, test_start, test_start + timedelta(days=test_days)))
+        train_start += timedelta(days=test_days)
+    return edges
+
+
+def walk_forward(outcomes, edges, metric="win_rate", min_trades=10):
+    """
+    Pick the best strategy of every train window and score it on the test
+    window after it.
+
+    outcomes holds one (alert_dates, expiration_dates, wins) triple per
+    strategy. A train window holds the trades that expired in it, a test
+    window the trades alerted in it. Strategies are ranked by train win rate
+    (with at least min_trades trades) or by number of wins, ties going to
+    the first one. Returns one dict per window.
+    """
+    boundaries = np.array(
+        [date for edge in edges for date in edge], dtype="datetime64[D]"
+    )
+    # [s, k]: trades of strategy s alerted (expired) before boundary k
+    alerted_wins = np.empty((len(outcomes), len(boundaries)), dtype=np.int64)
+    alerted_totals = np.empty_like(alerted_wins)
+    expired_wins = np.empty_like(alerted_wins)
+    expired_totals = np.empty_like(alerted_wins)
+    for row, (alert_dates, expiration_dates, strategy_wins) in enumerate(outcomes):
+        alerted_wins[row], alerted_totals[row] = counts_before(
+            alert_dates, strategy_wins, boundaries
+        )
+        order = np.argsort(expiration_dates, kind="stable")
+        expired_wins[row], expired_totals[row] = counts_before(
+            expiration_dates[order], strategy_wins[order], boundaries
+        )
+
+    shape = (len(outcomes), len(edges), 3)
+    alerted_wins = alerted_wins.reshape(shape)
+    alerted_totals = alerted_totals.reshape(shape)
+    expired_wins = expired_wins.reshape(shape)
+    expired_totals = expired_totals.reshape(shape)
+    train_wins = expired_wins[:, :, 1] - expired_wins[:, :, 0]
+    train_totals = expired_totals[:, :, 1] - expired_totals[:, :, 0]
+    test_wins = alerted_wins[:, :, 2] - alerted_wins[:, :, 1]
+    test_totals = alerted_totals[:, :, 2] - alerted_totals[:, :, 1]
+
+    if metric == "win":
+        score = train_wins.astype(float)
+    else:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = np.where(
+                train_totals >= max(min_trades, 1), train_wins / train_totals, -1.0
+            )
+    best = score.argmax(axis=0)
+
+    windows = []
+    for window, (train_start, test_start, test_end) in enumerate(edges):
+        chosen = best[window]
+        windows.append(
+            {
+                "train_start": train_start,
+                "test_start": test_start,
+                "test_end": test_end,
+                "strategy_index": int(chosen),
+                "train_win": int(train_wins[chosen, window]),
+                "train_total": int(train_totals[chosen, window]),
+                "test_win": int(test_wins[chosen, window]),
+                "test_total": int(test_totals[chosen, window]),
+            }
+        )
+    return windows
+
+
+def run_walk_forward(
+    ticker_data,
+    strategies,
+    start_date,
+    end_date,
+    train_days=1095,
+    test_days=182,
+    metric="win_rate",
+    min_trades=10,
+    workers=None,
+):
+    evaluate = partial(strategy_outcomes, start_date=start_date, end_date=end_date)
+    outcomes = [None] * len(strategies)
+    positions = {id(strategy): index for index, strategy in enumerate(strategies)}
+    for strategy, result in run_sweep(ticker_data, strategies, evaluate, workers):
+        outcomes[positions[id(strategy)]] = result
+
+    edges = window_edges(start_date, end_date, train_days, test_days)
+    windows = walk_forward(outcomes, edges, metric, min_trades)
+    for window in windows:
+        window["strategy"] = strategies[window["strategy_index"]]
+    return windows
+
+
+def print_walk_forward(windows):
+    print(f"{'Test window':<23} {'Train':>13} {'Test':>13}  Down / Up / Days")
+    test_win = test_total = 0
+    for window in windows:
+        strategy = window["strategy"]
+        train_rate = window["train_win"] / window["train_total"] * 100 if window["train_total"] else 0
+        test_rate = window["test_win"] / window["test_total"] * 100 if window["test_total"] else 0
+        print(
+            f"{window['test_start'].strftime('%Y-%m-%d')} - "
+            f"{(window['test_end'] - timedelta(days=1)).strftime('%Y-%m-%d')} "
+            f"{window['train_win']:>4}/{window['train_total']:<4}{train_rate:>4.0f}% "
+            f"{window['test_win']:>4}/{window['test_total']:<4}{test_rate:>4.0f}%  "
+            f"{float(strategy.deviation['down'])} / {float(strategy.deviation['up'])} / "
+            f"{strategy.expiration_date_round}"
+        )
+        test_win += window["test_win"]
+        test_total += window["test_total"]
+
+    if test_total:
+        print(f"Out-of-sample: {test_win}/{test_total} ({test_win / test_total * 100:.1f}%)")
+
+
+def main_walk_forward(ticker_symbol="VTI", days=7000):
+    specific_date = datetime(2024, 10, 17)
+    ticker_data = TickerData(ticker_symbol)
+    windows = run_walk_forward(
+        ticker_data,
+        backtrack_strategy(),
+        specific_date - timedelta(days=days - 1),
+        specific_date,
+    )
+    print_walk_forward(windows)
+
+
+if __name__ == "__main__":
+    main_walk_forward()
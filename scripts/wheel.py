@@ -0,0 +1,81 @@
+import numpy as np
+
+BORROW_RATE = 0.06  # Yearly fee on the borrowed shares
+CALL_CREDIT = 50  # Fixed credit collected for each weekly call
+
+
+def weekly_jump_tables(ticker_data):
+    """
+    Binary lifting tables over the weekly price path. next_week[0][i] is the
+    first session 7-11 days after session i (-1 past the end of the data) and
+    next_week[level] jumps 2**level weeks at once. max_close[level][i] is the
+    highest close among the 2**level weekly sessions starting at session i.
+    """
+    next_week = [
+        ticker_data.find_sessions(
+            ticker_data.dates + np.timedelta64(7, "D"), "forward", max_days=4
+        )
+    ]
+    max_close = [ticker_data.close]
+    while (next_week[-1] >= 0).any():
+        jump, highest = next_week[-1], max_close[-1]
+        valid = jump >= 0
+        target = np.where(valid, jump, 0)
+        next_week.append(np.where(valid, jump[target], -1))
+        max_close.append(np.where(valid, np.maximum(highest, highest[target]), highest))
+    return next_week, max_close
+
+
+def simulate_wheel(ticker_data, expiration_dates, cost_bases, credits):
+    """
+    Run the covered-call wheel of backtest_strategy for a batch of failed puts.
+
+    Every week after expiration the position pays the borrowing fee and
+    collects CALL_CREDIT for a call at ceil(cost_basis) + 5, until the first
+    weekly close at or above that strike assigns it. The assignment week is
+    found with a binary lifting search over the weekly price path and the
+    weekly accruals are summed in closed form.
+
+    Returns a dict of per-trade arrays: closed, days_held, borrowed_cost and
+    profit (0 for positions still open when the data runs out).
+    """
+    cost_bases = np.asarray(cost_bases, dtype=float)
+    credits = np.asarray(credits, dtype=float)
+    call_strikes = np.ceil(cost_bases) + 5
+    borrowing_fees = (cost_bases * 100 * BORROW_RATE * 7) / 365
+
+    next_week, max_close = weekly_jump_tables(ticker_data)
+
+    # First weekly session after expiration
+    start = ticker_data.find_sessions(
+        np.asarray(expiration_dates, dtype="datetime64[D]") + np.timedelta64(7, "D"),
+        "forward",
+        max_days=4,
+    )
+    current = np.where(start >= 0, start, 0)
+    weeks = np.zeros(len(cost_bases), dtype=np.int64)
+
+    # Skip ahead over every block of weeks that closes below the call strike
+    # while the path continues past it
+    for level in range(len(next_week) - 1, -1, -1):
+        jump = next_week[level][current]
+        skip = (start >= 0) & (jump >= 0) & (max_close[level][current] < call_strikes)
+        current = np.where(skip, jump, current)
+        weeks += np.where(skip, 2**level, 0)
+
+    closed = (start >= 0) & (ticker_data.close[current] >= call_strikes)
+    # Sessions in which the fee and call credit were booked
+    weeks_held = np.where(start >= 0, weeks + 1, 0)
+
+    borrowed_cost = weeks_held * borrowing_fees
+    total_credit = credits + weeks_held * CALL_CREDIT
+    profit = np.where(
+        closed, (call_strikes - cost_bases) * 100 + total_credit - borrowed_cost, 0.0
+    )
+    return {
+        "closed": closed,
+        # An open position also counts the week in which the data ran out
+        "days_held": 7 * np.where(closed, weeks_held, weeks_held + 1),
+        "borrowed_cost": borrowed_cost,
+        "profit": profit,
+    }
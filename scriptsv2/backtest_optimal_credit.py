@@ -1,7 +1,5 @@
-from itertools import product
 import numpy as np
-from db import get_all_trades
-from collections import defaultdict
+from tradebook import TradeBook
 
 def calculate_optimal_position_test(bankroll, win_rate, credit, kelly_fraction):
     """Modified position sizing calculator for testing different parameters"""
@@ -28,64 +26,81 @@ def calculate_optimal_position_test(bankroll, win_rate, credit, kelly_fraction):
         'risk_percentage': kelly * 100
     }
 
-def backtest_parameters(initial_capital=20000):
+def evaluate_grid(outcomes, win_rates, credits, kelly_fractions, initial_capital=20000):
+    """
+    Replay a win/loss sequence for every (win_rate, credit, kelly_fraction)
+    combination at once. The grid is laid out as an array of shape
+    (len(win_rates), len(credits), len(kelly_fractions)) and sized exactly like
+    calculate_optimal_position_test, so only the trade sequence is walked.
+    """
+    p = np.asarray(win_rates, dtype=float)[:, None, None] / 100
+    q = 1 - p
+    credit = np.asarray(credits, dtype=float)[None, :, None]
+    kelly_fraction = np.asarray(kelly_fractions, dtype=float)[None, None, :]
+
+    win_amount = credit * 100
+    loss_amount = (5 - credit) * 100
+
+    b = win_amount / loss_amount
+    kelly = np.maximum(0, p - (q / b)) * kelly_fraction
+    potential_profit = credit * 100 - 1
+    max_loss = loss_amount + 1
+
+    # The skip-after-loss rule only depends on the outcomes, so every
+    # combination takes the same trades: a trade is skipped when both it
+    # and the trade before it are losses
+    outcomes = np.asarray(outcomes, dtype=bool)
+    taken = np.ones(len(outcomes), dtype=bool)
+    taken[1:] = outcomes[1:] | outcomes[:-1]
+
+    running_capital = np.full(kelly.shape, float(initial_capital))
+    for win in outcomes[taken]:
+        optimal_risk = running_capital * kelly
+        num_spreads = np.clip(np.trunc(optimal_risk / loss_amount), 1, 1000)
+        if win:
+            running_capital += num_spreads * potential_profit
+        else:
+            running_capital -= num_spreads * max_loss
+
+    return running_capital, int(taken.sum())
+
+def backtest_parameters(initial_capital=20000, last_n=300, win_rates=None, credits=None, kelly_fractions=None):
     """Run backtest with different parameter combinations"""
     # Define parameter ranges
-    win_rates = np.arange(90, 92, 0.5)
-    credits = np.arange(0.30, 0.55, 0.05)
-    kelly_fractions = np.arange(0.3, 0.85, 0.05)
+    if win_rates is None:
+        win_rates = np.arange(90, 92, 0.5)
+    if credits is None:
+        credits = np.arange(0.30, 0.55, 0.05)
+    if kelly_fractions is None:
+        kelly_fractions = np.arange(0.3, 0.85, 0.05)
     
-    # Get historical trades
-    trades = get_all_trades(["SPY"])[-300:]
+    # Get historical trades, last_n=None replays the full history
+    trades = TradeBook.from_db(["SPY"], last_n=last_n)
+    outcomes = trades.is_status('win')
 
-    results = []
-    
-    # Test all combinations
-    for win_rate, credit, kelly_fraction in product(win_rates, credits, kelly_fractions):
-        running_capital = initial_capital
-        peak_capital = initial_capital
-        trades_taken = 0
-        
-        waiting_for_win = False
-        
-        for trade in trades:
-            if waiting_for_win:
-                if trade[8] == 'win':
-                    waiting_for_win = False
-                else:
-                    continue
-            
-            position = calculate_optimal_position_test(
-                running_capital, 
-                win_rate,
-                credit,
-                kelly_fraction
-            )
-            
-            trades_taken += 1
-            
-            if trade[8] == 'win':
-                running_capital += position['potential_profit']
-            else:
-                running_capital -= position['max_loss']
-                waiting_for_win = True
-        
-        # Calculate metrics
-        total_return = ((running_capital - initial_capital) / initial_capital) * 100
-        
-        results.append({
-            'win_rate': win_rate,
-            'credit': credit,
-            'kelly_fraction': kelly_fraction,
-            'final_capital': running_capital,
-            'total_return_pct': total_return,
+    final_capital, trades_taken = evaluate_grid(
+        outcomes, win_rates, credits, kelly_fractions, initial_capital
+    )
+    total_return = ((final_capital - initial_capital) / initial_capital) * 100
+
+    # Flattened in the same order as product(win_rates, credits, kelly_fractions),
+    # sorted by final capital with ties kept in that order
+    grid = np.stack(np.meshgrid(win_rates, credits, kelly_fractions, indexing='ij'), axis=-1).reshape(-1, 3)
+    final_capital = final_capital.ravel()
+    total_return = total_return.ravel()
+    order = np.argsort(-final_capital, kind='stable')
+
+    return [
+        {
+            'win_rate': grid[i, 0],
+            'credit': grid[i, 1],
+            'kelly_fraction': grid[i, 2],
+            'final_capital': final_capital[i],
+            'total_return_pct': total_return[i],
             'trades_taken': trades_taken
-        })
-    
-    # Sort results by final capital
-    results.sort(key=lambda x: x['final_capital'], reverse=True)
-    
-    return results
+        }
+        for i in order
+    ]
 
 def print_top_results(results, top_n=20):
     """Print top N results with formatting"""
@@ -0,0 +1,165 @@
+"""
+Long-running alert loop for main.py daemon.
+
+Every ticker's TickerData stays in memory between runs. The daemon sleeps
+until the close of the next trading session (plus close_delay, so the
+data source has published the bar), fetches only the bars from the last
+one held on, extends the indicators over them and alerts, instead of
+reloading the whole history and recomputing every indicator each day.
+The rolling statistics are saved next to the price cache after every
+update, so a restarted daemon resumes from them.
+"""
+import os
+import time
+import traceback
+from datetime import datetime, timedelta
+from datetime import time as clock_time
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from pipeline import run_pipeline
+from price_cache import (fetch_new_bars, get_cache_dir, is_offline, load_history, overlap_start, reload_history,
+                         same_basis, write_cache)
+from rolling import RollingStats
+from strategy import BANKROLL, TICKERS, TickerData, alert_signals, evaluate_signals, flush_alerts
+from trading_calendar import is_session
+
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+MARKET_CLOSE = clock_time(16, 0)
+
+def state_path(ticker):
+    return os.path.join(get_cache_dir(), f"{ticker}.rolling.npz")
+
+def resume_ticker_data(ticker, history):
+    """TickerData of history, starting from the saved rolling statistics when they match it"""
+    path = state_path(ticker)
+    rolling = RollingStats.load(path) if os.path.exists(path) else None
+    return TickerData(ticker, history, rolling=rolling)
+
+def save_state(ticker_data):
+    os.makedirs(get_cache_dir(), exist_ok=True)
+    ticker_data.rolling.save(state_path(ticker_data.ticker))
+
+def next_wake(now, close_delay=timedelta(minutes=5)):
+    """First session close plus close_delay after now, as a market time datetime"""
+    now = now.astimezone(MARKET_TIMEZONE)
+    day = now.date()
+    while True:
+        if is_session(np.datetime64(day)):
+            wake = datetime.combine(day, MARKET_CLOSE, MARKET_TIMEZONE) + close_delay
+            if wake > now:
+                return wake
+        day += timedelta(days=1)
+
+class AlertDaemon:
+    def __init__(self, tickers=None, bankroll=BANKROLL, close_delay=timedelta(minutes=5),
+                 poll_interval=30, max_wait=timedelta(hours=2), offline=None):
+        self.tickers = tickers or TICKERS
+        self.bankroll = bankroll
+        self.close_delay = close_delay
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.offline = is_offline() if offline is None else offline
+        self.ticker_data = {}
+
+    def warm_up(self):
+        """Load every history and compute its indicators once"""
+        for ticker, ticker_data in run_pipeline(self.tickers, resume_ticker_data, offline=self.offline):
+            self.ticker_data[ticker] = ticker_data
+            save_state(ticker_data)
+        print(f"Loaded {', '.join(sorted(self.ticker_data))}")
+
+    def load(self, ticker, reload=False):
+        """
+        Full history of ticker, downloaded again when reload is set and read
+        from the cache alone when offline. Raises ValueError when it is empty,
+        so the TickerData held for ticker is kept.
+        """
+        if reload and not self.offline:
+            history = reload_history(ticker)
+        else:
+            history = load_history(ticker, offline=self.offline)
+        if history.empty:
+            raise ValueError(f"No price history for {ticker}")
+        return history
+
+    def refresh(self, ticker):
+        """Append the bars published since the last one held, returns the TickerData"""
+        ticker_data = self.ticker_data.get(ticker)
+        if ticker_data is None:
+            ticker_data = self.ticker_data[ticker] = TickerData(ticker, self.load(ticker))
+            save_state(ticker_data)
+            return ticker_data
+
+        history = ticker_data.ticker_data
+        new_bars = fetch_new_bars(ticker, overlap_start(history), offline=self.offline)
+        if not same_basis(history, new_bars):
+            print(f"{ticker} prices were adjusted since they were loaded, reloading the history")
+            ticker_data = self.ticker_data[ticker] = TickerData(ticker, self.load(ticker, reload=True))
+            save_state(ticker_data)
+            return ticker_data
+
+        # The overlap bar was only fetched for the comparison
+        new_bars = new_bars[new_bars.index >= history.index[-1]]
+        if not new_bars.empty:
+            ticker_data.append_bars(new_bars)
+            if not self.offline:
+                write_cache(ticker, ticker_data.ticker_data)
+            save_state(ticker_data)
+        return ticker_data
+
+    def evaluate(self, ticker_data, session_date):
+        filtered_trades, trades = evaluate_signals(ticker_data, session_date)
+        alert_signals(ticker_data.ticker, filtered_trades, trades,
+                      ticker_data.get_date_price(session_date), session_date, self.bankroll)
+
+    def run_session(self, session_date, sleep=time.sleep):
+        """
+        Evaluate session_date for every ticker once its bar is available,
+        polling the source until max_wait has passed. Returns the tickers
+        that were evaluated.
+        """
+        deadline = time.monotonic() + self.max_wait.total_seconds()
+        pending = list(self.tickers)
+        evaluated = []
+        while True:
+            for ticker in list(pending):
+                try:
+                    ticker_data = self.refresh(ticker)
+                    if ticker_data.dates[-1] < np.datetime64(session_date, "D"):
+                        continue
+                except Exception as error:
+                    print(f"Failed to refresh {ticker}: {error}")
+                    continue
+                self.evaluate(ticker_data, session_date)
+                pending.remove(ticker)
+                evaluated.append(ticker)
+
+            if not pending or time.monotonic() + self.poll_interval > deadline:
+                break
+            sleep(self.poll_interval)
+
+        flush_alerts()
+        if pending:
+            print(f"No bar for {session_date} after {self.max_wait}: {', '.join(pending)}")
+        return evaluated
+
+    def run_forever(self):
+        self.warm_up()
+        while True:
+            wake = next_wake(datetime.now(MARKET_TIMEZONE), self.close_delay)
+            print(f"Next run at {wake:%Y-%m-%d %H:%M %Z}")
+            # Sleep in steps so a suspended host or a clock change does not oversleep
+            while (remaining := (wake - datetime.now(MARKET_TIMEZONE)).total_seconds()) > 0:
+                time.sleep(min(remaining, 600))
+
+            started = time.perf_counter()
+            try:
+                evaluated = self.run_session(wake.date())
+            except Exception:
+                traceback.print_exc()
+                continue
+            print(f"Evaluated {len(evaluated)} tickers in {time.perf_counter() - started:.2f}s\n")
+
+def main(close_delay=5, poll_interval=30):
+    AlertDaemon(close_delay=timedelta(minutes=close_delay), poll_interval=poll_interval).run_forever()
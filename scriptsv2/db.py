@@ -1,138 +1,384 @@
 import sqlite3
+from profiling import stage
 
 DB_NAME = 'trades.db'
 
+INSERT_TRADE = '''
+INSERT INTO trades (ticker, strategy_name, current_price, date_alerted,
+                   expiration_date, option_type, strike_price, status)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (ticker, strategy_name, expiration_date, option_type, strike_price) DO UPDATE
+SET status = excluded.status
+WHERE trades.status IS NULL AND excluded.status IS NOT NULL
+'''
+
+UNIQUE_COLUMNS = 'ticker, strategy_name, expiration_date, option_type, strike_price'
+
+DUPLICATE_GROUPS_QUERY = f"""
+    SELECT {UNIQUE_COLUMNS}, GROUP_CONCAT(id || ' ' || date_alerted, ', ')
+    FROM trades
+    GROUP BY {UNIQUE_COLUMNS}
+    HAVING COUNT(*) > 1
+"""
+
+class MigrationError(Exception):
+    pass
+
+def move_duplicate_trades(conn, move_duplicates):
+    """
+    Older databases may hold rows that the previous read-then-write check
+    let through. They are real alerts with their own date_alerted, so they
+    are never deleted silently: the migration stops and lists them unless
+    move_duplicates is set, which moves every row but the first stored of
+    each group into trades_duplicates.
+    """
+    groups = conn.execute(DUPLICATE_GROUPS_QUERY).fetchall()
+    if not groups:
+        return
+    if not move_duplicates:
+        listing = '\n'.join(f"  {' '.join(map(str, group[:5]))}: ids {group[5]}" for group in groups)
+        raise MigrationError(
+            f"{len(groups)} groups of trades share {UNIQUE_COLUMNS}:\n{listing}\n"
+            "Resolve them, or run python scriptsv2/db.py --move-duplicates to move all but "
+            "the first stored trade of each group into trades_duplicates")
+
+    conn.execute('CREATE TABLE IF NOT EXISTS trades_duplicates AS SELECT * FROM trades WHERE 0')
+    losing = f'id NOT IN (SELECT MIN(id) FROM trades GROUP BY {UNIQUE_COLUMNS})'
+    conn.execute(f'INSERT INTO trades_duplicates SELECT * FROM trades WHERE {losing}')
+    moved = conn.execute(f'DELETE FROM trades WHERE {losing}').rowcount
+    print(f"Moved {moved} duplicate trades into trades_duplicates")
+
+# Each entry upgrades the schema by one version, tracked in PRAGMA user_version.
+# Entries are SQL statements or functions called with (conn, move_duplicates)
+MIGRATIONS = [
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS trades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticker TEXT NOT NULL,
+            strategy_name TEXT NOT NULL,
+            current_price REAL NOT NULL,
+            date_alerted DATE NOT NULL,
+            expiration_date DATE NOT NULL,
+            option_type TEXT NOT NULL,
+            strike_price REAL NOT NULL,
+            status TEXT
+        )
+        ''',
+    ],
+    [
+        move_duplicate_trades,
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_trades_unique
+        ON trades (ticker, strategy_name, expiration_date, option_type, strike_price)
+        ''',
+    ],
+    [
+        # get_trades_for_streak: ticker + date range, read in date order
+        '''
+        CREATE INDEX IF NOT EXISTS idx_trades_streak
+        ON trades (ticker, date_alerted, status)
+        ''',
+        # get_expired_trades: only unsettled trades are ever looked up
+        '''
+        CREATE INDEX IF NOT EXISTS idx_trades_pending
+        ON trades (expiration_date, date_alerted) WHERE status IS NULL
+        ''',
+        # check_duplicate_trades
+        '''
+        CREATE INDEX IF NOT EXISTS idx_trades_duplicates
+        ON trades (ticker, strategy_name, expiration_date, date_alerted)
+        ''',
+    ],
+    [
+        # High-water marks of the incremental backfill
+        '''
+        CREATE TABLE IF NOT EXISTS backfill_state (
+            ticker TEXT NOT NULL,
+            strategy_name TEXT NOT NULL,
+            parameters TEXT NOT NULL,
+            last_date DATE NOT NULL,
+            PRIMARY KEY (ticker, strategy_name)
+        )
+        ''',
+    ],
+    [
+        # iter_trades: date order with the row id as tie-breaker, which the
+        # index carries implicitly
+        '''
+        CREATE INDEX IF NOT EXISTS idx_trades_history
+        ON trades (ticker, date_alerted)
+        ''',
+    ],
+]
+
+STREAK_QUERY = """
+    SELECT date_alerted, status
+    FROM trades
+    WHERE date_alerted <= ?
+    AND status IS NOT NULL
+    AND ticker = ?
+    ORDER BY date_alerted DESC
+"""
+
+EXPIRED_QUERY = """
+    SELECT id, ticker, strategy_name, current_price, date_alerted,
+           expiration_date, option_type, strike_price
+    FROM trades
+    WHERE status IS NULL
+    AND expiration_date <= ?
+    AND date_alerted <= ?
+"""
+
+DUPLICATE_QUERY = """
+    SELECT COUNT(*)
+    FROM trades
+    WHERE ticker = ?
+    AND strategy_name = ?
+    AND expiration_date = ?
+    AND date_alerted BETWEEN ? AND ?
+"""
+
+# The lookup ON CONFLICT performs for every insert
+EXISTING_TRADE_QUERY = """
+    SELECT id FROM trades
+    WHERE ticker = ?
+    AND strategy_name = ?
+    AND expiration_date = ?
+    AND option_type = ?
+    AND strike_price = ?
+"""
+
+def history_query(ticker_count, start_date=False, end_date=False, last_n=False):
+    """Trades of ticker_count tickers in date order, newest first when limited to the last N"""
+    query = f"SELECT * FROM trades WHERE ticker IN ({','.join('?' * ticker_count)})"
+    if start_date:
+        query += " AND date_alerted >= ?"
+    if end_date:
+        query += " AND date_alerted <= ?"
+    if last_n:
+        return query + " ORDER BY date_alerted DESC, id DESC LIMIT ?"
+    return query + " ORDER BY date_alerted, id"
+
+# Queries that must be served by an index, with sample parameters
+HOT_QUERIES = {
+    'get_trades_for_streak': (STREAK_QUERY, ('2024-01-01', 'SPY')),
+    'get_expired_trades': (EXPIRED_QUERY, ('2024-01-01', '2024-01-01')),
+    'check_duplicate_trades': (DUPLICATE_QUERY, ('SPY', 'Trend Up', '2024-01-12', '2024-01-01', '2024-01-05')),
+    'save_trade_to_db': (EXISTING_TRADE_QUERY, ('SPY', 'Trend Up', '2024-01-12', 'put', 470.0)),
+    'iter_trades': (history_query(1, start_date=True, end_date=True), ('SPY', '2020-01-01', '2024-01-01')),
+    'iter_trades_last_n': (history_query(1, last_n=True), ('SPY', 300)),
+}
+
+_connection = None
+
 def create_connection():
-    conn = sqlite3.connect(DB_NAME)
-    return conn
+    """Return the process-wide connection, opening and migrating it on first use"""
+    global _connection
+    if _connection is None:
+        conn = sqlite3.connect(DB_NAME)
+        try:
+            migrate(conn)
+        except Exception:
+            conn.close()
+            raise
+        _connection = conn
+    return _connection
+
+def close_connection():
+    global _connection
+    if _connection is not None:
+        _connection.close()
+        _connection = None
+
+def migrate(conn, move_duplicates=False):
+    """
+    Apply pending migrations in place, returns the resulting schema version.
+    A migration that raises is rolled back with the ones after it left pending.
+    """
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for number, statements in enumerate(MIGRATIONS[version:], version + 1):
+        with conn:
+            conn.execute('BEGIN')
+            for statement in statements:
+                if callable(statement):
+                    statement(conn, move_duplicates)
+                else:
+                    conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {number}')
+    return max(version, len(MIGRATIONS))
 
 def create_table():
     conn = create_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS trades (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        ticker TEXT NOT NULL,
-        strategy_name TEXT NOT NULL,
-        current_price REAL NOT NULL,
-        date_alerted DATE NOT NULL,
-        expiration_date DATE NOT NULL,
-        option_type TEXT NOT NULL,
-        strike_price REAL NOT NULL,
-        status TEXT
-    )
-    ''')
-    cursor.execute('DELETE FROM trades')
-
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute('DELETE FROM trades')
+        conn.execute('DELETE FROM backfill_state')
 
 def get_all_trades(ticker_list):
     conn = create_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM trades WHERE ticker IN ({})'.format(','.join('?' * len(ticker_list))), ticker_list)
-    trades = cursor.fetchall()
-    conn.close()
-    return trades
+    cursor.execute('SELECT * FROM trades WHERE ticker IN ({}) ORDER BY date_alerted, id'.format(','.join('?' * len(ticker_list))), ticker_list)
+    return cursor.fetchall()
+
+def iter_trades(ticker_list, start_date_str=None, end_date_str=None, last_n=None, batch_size=1000):
+    """
+    Yield the trade rows of ticker_list ordered by date alerted (ties in
+    insertion order), optionally within [start_date_str, end_date_str] and
+    limited to the last last_n of them. Rows are fetched from the cursor
+    batch_size at a time, so only the last_n window is ever held in memory.
+    """
+    params = [*ticker_list]
+    if start_date_str:
+        params.append(start_date_str)
+    if end_date_str:
+        params.append(end_date_str)
+
+    conn = create_connection()
+    query = history_query(len(ticker_list), bool(start_date_str), bool(end_date_str), last_n is not None)
+    if last_n is not None:
+        # Newest last_n rows, read back in chronological order
+        with stage("db_read"):
+            rows = conn.execute(query, (*params, last_n)).fetchall()
+        yield from reversed(rows)
+        return
+
+    # Only the fetches are timed, not the consumer between batches
+    with stage("db_read"):
+        cursor = conn.execute(query, params)
+        rows = cursor.fetchmany(batch_size)
+    while rows:
+        yield from rows
+        with stage("db_read"):
+            rows = cursor.fetchmany(batch_size)
+
+def _trade_row(trade, status):
+    return (trade.ticker, trade.strategy_name, trade.current_price,
+            trade.date_alerted.strftime('%Y-%m-%d'),
+            trade.expiration_date.strftime('%Y-%m-%d'),
+            trade.option_type, trade.strike_price, status)
 
 def save_trade_to_db(trade, status):
     conn = create_connection()
-    cursor = conn.cursor()
-    
-    # First check if trade already exists
-    cursor.execute('''
-    SELECT id FROM trades 
-    WHERE ticker = ? 
-    AND strategy_name = ? 
-    AND expiration_date = ? 
-    AND option_type = ? 
-    AND strike_price = ?
-    ''', (trade.ticker, trade.strategy_name, 
-          trade.expiration_date.strftime('%Y-%m-%d'),
-          trade.option_type, trade.strike_price))
-    
-    existing_trade = cursor.fetchone()
-    
-    if existing_trade:
-        # Trade already exists, don't insert
-        conn.close()
-        return False
-        
-    # Trade doesn't exist, proceed with insert
-    cursor.execute('''
-    INSERT INTO trades (ticker, strategy_name, current_price, date_alerted, 
-                       expiration_date, option_type, strike_price, status)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (trade.ticker, trade.strategy_name, trade.current_price,
-          trade.date_alerted.strftime('%Y-%m-%d'), 
-          trade.expiration_date.strftime('%Y-%m-%d'),
-          trade.option_type, trade.strike_price, status))
-    
-    conn.commit()
-    conn.close()
-    return True
+    with stage("db_write"), conn:
+        # Trades that already exist are skipped by the unique index, unless
+        # they were stored unsettled and status settles them
+        cursor = conn.execute(INSERT_TRADE, _trade_row(trade, status))
+    return cursor.rowcount == 1
+
+def save_trades(trades):
+    """
+    Insert many trades in a single transaction, each with its own status.
+    A trade already stored without a status takes the new one, so the
+    backfill settles the trades alerted by run. Returns the number of
+    trades inserted or settled.
+    """
+    conn = create_connection()
+    changes_before = conn.total_changes
+    with stage("db_write"), conn:
+        conn.executemany(INSERT_TRADE, (_trade_row(trade, trade.status) for trade in trades))
+    return conn.total_changes - changes_before
+
+def delete_trades(ticker, strategy_name):
+    conn = create_connection()
+    with conn:
+        conn.execute('DELETE FROM trades WHERE ticker = ? AND strategy_name = ?', (ticker, strategy_name))
+
+def get_backfill_state(ticker, strategy_name):
+    """Return (parameters, last_date) of the last backfill, None if there was none"""
+    conn = create_connection()
+    return conn.execute('''
+        SELECT parameters, last_date FROM backfill_state
+        WHERE ticker = ? AND strategy_name = ?
+    ''', (ticker, strategy_name)).fetchone()
+
+def save_backfill_state(ticker, strategy_name, parameters, last_date_str):
+    conn = create_connection()
+    with conn:
+        conn.execute('''
+            INSERT INTO backfill_state (ticker, strategy_name, parameters, last_date)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (ticker, strategy_name)
+            DO UPDATE SET parameters = excluded.parameters, last_date = excluded.last_date
+        ''', (ticker, strategy_name, parameters, last_date_str))
 
 def get_trades_for_streak(ticker, check_date_str):
     conn = create_connection()
     cursor = conn.cursor()
-    
+
     # Get trades up to check_date ordered by date descending
-    cursor.execute("""
-        SELECT date_alerted, status
-        FROM trades 
-        WHERE date_alerted <= ?
-        AND status IS NOT NULL 
-        AND ticker = ?
-        ORDER BY date_alerted DESC
-    """, (check_date_str, ticker))
-    
-    trades = cursor.fetchall()
-    conn.close()
-    return trades
+    with stage("db_read"):
+        cursor.execute(STREAK_QUERY, (check_date_str, ticker))
+        return cursor.fetchall()
 
 def get_expired_trades(check_date_str):
     conn = create_connection()
     cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, ticker, strategy_name, current_price, date_alerted, 
-               expiration_date, option_type, strike_price 
-        FROM trades 
-        WHERE status IS NULL 
-        AND expiration_date <= ?
-        AND date_alerted <= ?
-    """, (check_date_str, check_date_str))
-    trades = cursor.fetchall()
-    conn.close()
-    return trades
+    cursor.execute(EXPIRED_QUERY, (check_date_str, check_date_str))
+    return cursor.fetchall()
 
 def update_trade_status(trade_id, status):
+    update_trade_statuses([(trade_id, status)])
+
+def update_trade_statuses(updates):
+    """Apply (trade_id, status) pairs in a single transaction"""
     conn = create_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE trades 
-        SET status = ? 
-        WHERE id = ?
-    """, (status, trade_id))
-    conn.commit()
-    conn.close()
+    with stage("db_write"), conn:
+        conn.executemany("""
+            UPDATE trades
+            SET status = ?
+            WHERE id = ?
+        """, ((status, trade_id) for trade_id, status in updates))
 
 def check_duplicate_trades(trade, date_limit_str, check_date_str):
     conn = create_connection()
     cursor = conn.cursor()
-    cursor.execute("""
-        SELECT COUNT(*) 
-        FROM trades 
-        WHERE ticker = ? 
-        AND strategy_name = ? 
-        AND expiration_date = ? 
-        AND date_alerted BETWEEN ? AND ?
-    """, (
+    cursor.execute(DUPLICATE_QUERY, (
         trade.ticker,
         trade.strategy_name,
         trade.expiration_date.strftime('%Y-%m-%d'),
         date_limit_str,
         check_date_str
     ))
-    count = cursor.fetchone()[0]
-    conn.close()
-    return count
+    return cursor.fetchone()[0]
+
+def explain_hot_queries(conn=None):
+    """Return the EXPLAIN QUERY PLAN details of every hot query, keyed by name"""
+    conn = conn or create_connection()
+    return {
+        name: [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query, params)]
+        for name, (query, params) in HOT_QUERIES.items()
+    }
+
+def check_query_plans(conn=None):
+    """
+    Return the hot queries whose plan scans the trades table or sorts
+    the results instead of reading them from an index.
+    """
+    slow_queries = {}
+    for name, details in explain_hot_queries(conn).items():
+        uses_index = any(detail.startswith('SEARCH') and 'INDEX' in detail for detail in details)
+        scans = any(detail.startswith('SCAN') or 'TEMP B-TREE' in detail for detail in details)
+        if scans or not uses_index:
+            slow_queries[name] = details
+    return slow_queries
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Migrate the trades database and check the hot query plans")
+    parser.add_argument("--move-duplicates", action="store_true",
+                        help="Move trades that share their unique columns with an earlier one into trades_duplicates")
+    args = parser.parse_args()
+    conn = sqlite3.connect(DB_NAME)
+    try:
+        migrate(conn, move_duplicates=args.move_duplicates)
+    except MigrationError as error:
+        raise SystemExit(str(error))
+    _connection = conn
+    print(f"Schema version: {conn.execute('PRAGMA user_version').fetchone()[0]}")
+    for name, details in explain_hot_queries(conn).items():
+        print(f"{name}: {' | '.join(details)}")
+
+    slow_queries = check_query_plans(conn)
+    if slow_queries:
+        raise SystemExit(f"Queries not served by an index: {', '.join(slow_queries)}")
@@ -0,0 +1,96 @@
+"""
+Local stand-in for the Telegram Bot API. Accepts sendMessage calls at
+/bot<TOKEN>/sendMessage, keeps every message it accepted, and can answer
+the first requests with rate limit (429) or server (500) errors and wait
+before every response. Point TELEGRAM_API_URL at it to exercise the
+notifier without network access:
+
+    python scriptsv2/fake_telegram.py --port 8766 --fail 2 --delay 0.5
+    ENV=PROD TELEGRAM_API_URL=http://127.0.0.1:8766 python scriptsv2/main.py run --offline
+"""
+import argparse
+import json
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class TelegramHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        if not self.path.endswith("/sendMessage"):
+            self.send_json(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+            return
+
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        time.sleep(server.delay)
+        with server.lock:
+            server.requests += 1
+            failing = server.requests <= server.fail
+
+        if failing and server.error == 429:
+            self.send_json(429, {"ok": False, "error_code": 429,
+                                 "description": f"Too Many Requests: retry after {server.retry_after}",
+                                 "parameters": {"retry_after": server.retry_after}})
+        elif failing:
+            self.send_json(server.error, {"ok": False, "error_code": server.error,
+                                          "description": HTTPStatus(server.error).phrase})
+        else:
+            with server.lock:
+                server.messages.append(payload)
+                message_id = len(server.messages)
+            self.send_json(200, {"ok": True, "result": {"message_id": message_id, "text": payload.get("text")}})
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class PrintingHandler(TelegramHandler):
+    """Also prints every answer, for the command line"""
+
+    def send_json(self, status, body):
+        super().send_json(status, body)
+        print(f"{status} {body.get('result', {}).get('text') or body.get('description')}\n")
+
+def make_server(host="127.0.0.1", port=0, fail=0, error=429, retry_after=0, delay=0.0):
+    server = ThreadingHTTPServer((host, port), TelegramHandler)
+    server.daemon_threads = True
+    server.fail = fail
+    server.error = error
+    server.retry_after = retry_after
+    server.delay = delay
+    server.requests = 0
+    server.messages = []
+    server.lock = threading.Lock()
+    server.url = f"http://{host}:{server.server_address[1]}"
+    return server
+
+def start_server(host="127.0.0.1", port=0, fail=0, error=429, retry_after=0, delay=0.0):
+    """Serve from a background thread, the base url is in server.url and the accepted payloads in server.messages"""
+    server = make_server(host, port, fail, error, retry_after, delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API that prints the messages it receives")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--fail", type=int, default=0, help="Answer the first N requests with an error")
+    parser.add_argument("--error", type=int, default=429, help="HTTP status of the failed requests")
+    parser.add_argument("--retry-after", type=int, default=0, help="retry_after of the 429 answers")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before each response")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = make_server(args.host, args.port, args.fail, args.error, args.retry_after, args.delay)
+    server.RequestHandlerClass = PrintingHandler
+    print(f"Fake Telegram API on {server.url}")
+    server.serve_forever()
@@ -1,36 +1,97 @@
+import os
 import argparse
-from datetime import datetime
-from populate_db import populate_historical_trades
-from stats import main as run_statistics
-from strategy import main as run_strategy 
-from db import create_table
+import profiling
+
+# Every action imports its modules when it runs, so e.g. stats and --help
+# never load pandas or yfinance. benchmarks/startup.py checks this.
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Trading application command-line interface")
-    parser.add_argument("action", choices=["backtest", "run", "stats"],
-                        help="Action to perform: 'backtest' for historical data, 'run' for current day's strategy, 'stats' to view statistics")
+    parser.add_argument("action", choices=["backtest", "run", "stats", "montecarlo", "daemon"],
+                        help="Action to perform: 'backtest' for historical data, 'run' for current day's strategy, 'stats' to view statistics, 'montecarlo' to simulate resampled trade sequences, 'daemon' to keep running and alert after every market close")
+    parser.add_argument("--offline", action="store_true",
+                        help="Read price history only from the local cache, without downloading")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Backtest only the dates after the last backfill instead of rebuilding the table")
+    parser.add_argument("--paths", type=positive_int, default=10000,
+                        help="Number of Monte Carlo paths per ticker")
+    parser.add_argument("--block-size", type=positive_int, default=1,
+                        help="Resample outcomes in blocks of this many consecutive trades to keep streaks")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Random seed for reproducible Monte Carlo runs")
+    parser.add_argument("--close-delay", type=int, default=5,
+                        help="Daemon: minutes after the market close to fetch the new bar")
+    parser.add_argument("--poll-interval", type=int, default=30,
+                        help="Daemon: seconds between fetches while the new bar is not published yet")
+    parser.add_argument("--profile", nargs="?", const="profile.json", default=None, metavar="REPORT",
+                        help="Record wall time, call counts and peak memory of every stage and write them as JSON (default: profile.json)")
+    parser.add_argument("--cprofile", default=None, metavar="DUMP",
+                        help="Also write a cProfile dump of the slowest stage (implies --profile, runs the pipeline serially)")
     return parser.parse_args()
 
-def backtest():
+def backtest(incremental=False):
+    from db import create_table
+    from populate_db import populate_historical_trades
+    from stats import main as run_statistics
+
     print("Starting backtest process...")
-    print("1. Creating database table if not exists...")
-    create_table()
+    if incremental:
+        print("1. Resuming from the last backfilled dates...")
+    else:
+        print("1. Creating database table if not exists...")
+        create_table()
     print("2. Populating database with historical trades...")
-    populate_historical_trades()
+    populate_historical_trades(incremental=incremental)
     print("3. Generating trading statistics...")
     run_statistics()
     print("Backtest process completed.")
 
 def main():
     args = parse_args()
-    
+    if args.offline:
+        os.environ["PRICE_CACHE_OFFLINE"] = "1"
+
+    if args.cprofile and args.profile is None:
+        args.profile = "profile.json"
+    if args.profile is None:
+        run_action(args)
+        return
+
+    profiling.start(cprofile=bool(args.cprofile))
+    try:
+        run_action(args)
+    finally:
+        report, profiles = profiling.stop(args.action)
+        profiling.write_report(report, args.profile)
+        profiling.print_report(report)
+        print(f"Profile written to {args.profile}")
+        if args.cprofile:
+            hottest = profiling.dump_hottest(report, profiles, args.cprofile)
+            if hottest:
+                print(f"cProfile of stage '{hottest}' written to {args.cprofile}")
+
+def run_action(args):
     if args.action == "backtest":
-        backtest()
+        backtest(incremental=args.incremental)
     elif args.action == "run":
+        from strategy import main as run_strategy
         run_strategy()
         print("\n")
     elif args.action == "stats":
+        from stats import main as run_statistics
         run_statistics()
+    elif args.action == "montecarlo":
+        from montecarlo import main as run_montecarlo
+        run_montecarlo(paths=args.paths, block_size=args.block_size, seed=args.seed)
+    elif args.action == "daemon":
+        from daemon import main as run_daemon
+        run_daemon(close_delay=args.close_delay, poll_interval=args.poll_interval)
 
 if __name__ == "__main__":
     main()
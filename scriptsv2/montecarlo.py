@@ -0,0 +1,110 @@
+import numpy as np
+from tradebook import TradeBook
+from sizing import POSITION_CREDIT, kelly_parameters
+
+PERCENTILES = [5, 25, 50, 75, 95]
+CHUNK_PATHS = 4096
+
+def resample_outcomes(outcomes, paths, length=None, block_size=1, rng=None):
+    """
+    Bootstrap paths of win/loss outcomes, returned as a (length, paths)
+    array. With block_size > 1 every path is built from consecutive runs of
+    block_size historical outcomes (wrapping around the end), which keeps
+    the winning and losing streaks that iid draws would break up.
+    """
+    outcomes = np.asarray(outcomes, dtype=bool)
+    rng = rng or np.random.default_rng()
+    length = length or len(outcomes)
+
+    blocks = -(-length // block_size)
+    starts = rng.integers(0, len(outcomes), size=(blocks, 1, paths))
+    steps = np.arange(block_size)[None, :, None]
+    index = ((starts + steps) % len(outcomes)).reshape(blocks * block_size, paths)
+    return outcomes[index[:length]]
+
+def simulate_paths(wins, initial_capital=20000, win_rate=92.0, ruin_fraction=0.5):
+    """
+    Replay every column of a (length, paths) win/loss array with the sizing
+    and skip-after-loss rule of stats.equity_curve, all paths at once.
+    A path is ruined once its capital falls to ruin_fraction of the initial
+    capital or below.
+    """
+    wins = np.asarray(wins, dtype=bool)
+    taken = np.ones_like(wins)
+    taken[1:] = wins[1:] | wins[:-1]
+
+    kelly, loss_amount = kelly_parameters(win_rate)
+    spread_profit = POSITION_CREDIT * 100 - 1
+    spread_max_loss = loss_amount + 1
+
+    capital = np.full(wins.shape[1], float(initial_capital))
+    peak = capital.copy()
+    max_drawdown = np.zeros_like(capital)
+    lowest = capital.copy()
+    for step_wins, step_taken in zip(wins, taken):
+        num_spreads = np.clip(np.trunc(capital * kelly / loss_amount), 1, 1000)
+        change = np.where(step_wins, num_spreads * spread_profit, -(num_spreads * spread_max_loss / 2))
+        capital += np.where(step_taken, change, 0)
+        np.maximum(peak, capital, out=peak)
+        np.maximum(max_drawdown, (peak - capital) / peak * 100, out=max_drawdown)
+        np.minimum(lowest, capital, out=lowest)
+
+    return {
+        'final_capital': capital,
+        'max_drawdown_pct': max_drawdown,
+        'ruined': lowest <= initial_capital * ruin_fraction,
+        'trades_taken': taken.sum(axis=0),
+    }
+
+def run_montecarlo(outcomes, paths=10000, length=None, block_size=1, initial_capital=20000,
+                   win_rate=92.0, ruin_fraction=0.5, seed=None):
+    """Simulate bootstrapped paths of one outcome sequence in chunks of CHUNK_PATHS"""
+    if paths < 1 or block_size < 1:
+        raise ValueError(f"paths and block_size must be at least 1, got {paths} and {block_size}")
+    rng = np.random.default_rng(seed)
+    results = []
+    for start in range(0, paths, CHUNK_PATHS):
+        wins = resample_outcomes(outcomes, min(CHUNK_PATHS, paths - start), length, block_size, rng)
+        results.append(simulate_paths(wins, initial_capital, win_rate, ruin_fraction))
+    return {name: np.concatenate([result[name] for result in results]) for name in results[0]}
+
+def summarize(results, initial_capital=20000):
+    final_capital = results['final_capital']
+    return {
+        'paths': len(final_capital),
+        'final_capital': dict(zip(PERCENTILES, np.percentile(final_capital, PERCENTILES))),
+        'mean_final_capital': float(final_capital.mean()),
+        'max_drawdown_pct': dict(zip(PERCENTILES, np.percentile(results['max_drawdown_pct'], PERCENTILES))),
+        'loss_probability': float((final_capital < initial_capital).mean()),
+        'ruin_probability': float(results['ruined'].mean()),
+    }
+
+def print_summary(ticker, summary, trades, block_size, ruin_fraction):
+    print(f"\n=== Monte Carlo: {ticker} ===")
+    print(f"{summary['paths']:,} paths of {trades} trades, block size {block_size}")
+    print(f"{'Percentile':>10} {'Final $':>14} {'DrawDown%':>10}")
+    for percentile in PERCENTILES:
+        print(f"{percentile:>10} {summary['final_capital'][percentile]:>14,.0f} "
+              f"{summary['max_drawdown_pct'][percentile]:>10.1f}")
+    print(f"Mean Final Capital: ${summary['mean_final_capital']:,.0f}")
+    print(f"Probability of Loss: {summary['loss_probability'] * 100:.2f}%")
+    print(f"Probability of Ruin (capital <= {ruin_fraction:.0%} of start): {summary['ruin_probability'] * 100:.2f}%")
+
+def main(tickers=None, paths=10000, block_size=1, length=None, initial_capital=20000,
+         ruin_fraction=0.5, seed=None):
+    tickers = tickers or ["IWM", "VTI", "QQQ", "SPY"]
+    book = TradeBook.from_db(tickers)
+    for ticker in tickers:
+        trades = book.for_ticker(ticker)
+        # Unsettled trades are neither wins nor losses
+        outcomes = trades[~trades.is_status(None)].is_status('win')
+        if len(outcomes) == 0:
+            print(f"No trades found for {ticker}")
+            continue
+        results = run_montecarlo(outcomes, paths, length, block_size, initial_capital,
+                                 ruin_fraction=ruin_fraction, seed=seed)
+        print_summary(ticker, summarize(results, initial_capital), length or len(outcomes),
+                      block_size, ruin_fraction)
+
+if __name__ == "__main__":
+    main()
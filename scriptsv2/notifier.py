@@ -0,0 +1,195 @@
+"""
+Telegram notifications sent from a background thread.
+
+Notifier.send() only queues the text, so a slow or failing Telegram API
+never holds up signal evaluation. flush() and close() end a batch: the
+background thread joins the messages queued since the previous one into
+as few texts as Telegram's MAX_MESSAGE_LENGTH allows and sends those, in
+order, through the Bot API sendMessage method. Sends are spaced by a rate
+limit, and rate limited (429), server (5xx) and network errors are
+retried with backoff. The process-wide notifier of get_notifier() is
+closed at exit. Its thread is started up front since no new thread may
+be started while the interpreter shuts down.
+
+TELEGRAM_API_URL replaces https://api.telegram.org, e.g. with the local
+fake in fake_telegram.py.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+
+DEFAULT_API_URL = "https://api.telegram.org"
+MAX_MESSAGE_LENGTH = 4096
+SEPARATOR = "\n\n"
+
+_STOP = object()
+
+class TelegramError(Exception):
+    def __init__(self, message, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+class TelegramClient:
+    """Minimal Bot API client, one sendMessage call per send_message"""
+
+    def __init__(self, token, chat_id, api_url=None, timeout=10):
+        self.token = token
+        self.chat_id = chat_id
+        self.api_url = (api_url or os.environ.get("TELEGRAM_API_URL") or DEFAULT_API_URL).rstrip("/")
+        self.timeout = timeout
+
+    def send_message(self, text):
+        request = urllib.request.Request(
+            f"{self.api_url}/bot{self.token}/sendMessage",
+            data=json.dumps({"chat_id": self.chat_id, "text": text}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as error:
+            try:
+                body = json.load(error)
+            except ValueError:
+                body = {}
+            retry_after = body.get("parameters", {}).get("retry_after")
+            raise TelegramError(f"HTTP {error.code}: {body.get('description', error.reason)}",
+                                retryable=error.code == 429 or error.code >= 500,
+                                retry_after=retry_after) from error
+        except (urllib.error.URLError, OSError) as error:
+            raise TelegramError(str(error), retryable=True) from error
+
+def split_message(text, limit=MAX_MESSAGE_LENGTH):
+    """Pieces of at most limit characters, cut at line ends where possible"""
+    pieces = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        pieces.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text:
+        pieces.append(text)
+    return pieces
+
+def coalesce(messages, limit=MAX_MESSAGE_LENGTH):
+    """Join messages, in order, into as few texts of at most limit characters as possible"""
+    texts = []
+    current = ""
+    for message in messages:
+        for piece in split_message(message, limit):
+            if current and len(current) + len(SEPARATOR) + len(piece) <= limit:
+                current += SEPARATOR + piece
+            else:
+                if current:
+                    texts.append(current)
+                current = piece
+    if current:
+        texts.append(current)
+    return texts
+
+class RateLimiter:
+    """Spaces calls at least 1 / rate seconds apart"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class Notifier:
+    def __init__(self, client, rate=1.0, retries=4, backoff=1.0, max_length=MAX_MESSAGE_LENGTH):
+        self.client = client
+        self.retries = retries
+        self.backoff = backoff
+        self.max_length = max_length
+        self.rate_limiter = RateLimiter(rate)
+        self.sent = 0
+        self.failed = 0
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+        self.thread.start()
+
+    def send(self, text):
+        """Queue text for the next flush, returns immediately"""
+        if text:
+            self.queue.put(text)
+
+    def flush(self, timeout=None):
+        """Send everything queued so far as one batch and wait for it, True if it finished"""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=None):
+        """Send everything queued and stop the threads"""
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def _run(self):
+        while True:
+            batch, marker = self._collect()
+            # One at a time, so the parts of a long batch arrive in order
+            for text in coalesce(batch, self.max_length):
+                self._deliver(text)
+            if marker is _STOP:
+                return
+            marker.set()
+
+    def _collect(self):
+        """Messages queued up to the next flush or stop marker, and that marker"""
+        batch = []
+        while True:
+            item = self.queue.get()
+            if item is _STOP or isinstance(item, threading.Event):
+                return batch, item
+            batch.append(item)
+
+    def _deliver(self, text):
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.wait()
+            try:
+                self.client.send_message(text)
+                self.sent += 1
+                return True
+            except Exception as error:
+                retryable = isinstance(error, TelegramError) and error.retryable
+                if not retryable or attempt == self.retries:
+                    print(f"Telegram message not sent: {error}")
+                    self.failed += 1
+                    return False
+                time.sleep(error.retry_after or self.backoff * 2 ** attempt)
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+def get_notifier():
+    """Process-wide Notifier for TELEGRAM_TOKEN and TELEGRAM_CHAT_ID, flushed at exit"""
+    global _notifier
+    with _notifier_lock:
+        if _notifier is None:
+            client = TelegramClient(os.environ.get("TELEGRAM_TOKEN"), os.environ.get("TELEGRAM_CHAT_ID"))
+            _notifier = Notifier(client)
+            atexit.register(_notifier.close)
+        return _notifier
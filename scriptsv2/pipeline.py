@@ -0,0 +1,65 @@
+import os
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import profiling
+from price_cache import load_history
+
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", 8))
+
+def run_pipeline(tickers, process, download_workers=None, compute_workers=None, offline=None):
+    """
+    Download the history of every ticker on a bounded thread pool and hand
+    each one to process(ticker, history) on a process pool as soon as it
+    arrives, so downloads overlap with signal generation.
+
+    process must be a picklable module level callable (use functools.partial
+    for extra arguments). Yields (ticker, result) pairs in completion order.
+    Tickers whose download fails are reported and skipped. offline is
+    passed to load_history.
+    """
+    download = partial(load_history, offline=offline)
+    if profiling.serial():
+        yield from _run_serial(tickers, process, download)
+        return
+
+    compute_workers = compute_workers or os.cpu_count()
+    # A single worker gains nothing from a separate process, a thread avoids
+    # the pool start-up and pickling the histories
+    executor = ProcessPoolExecutor if compute_workers > 1 else ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=download_workers or DOWNLOAD_WORKERS) as downloads, \
+            executor(max_workers=compute_workers) as compute:
+        downloading = {downloads.submit(download, ticker): ticker for ticker in tickers}
+        computing = {}
+
+        while downloading or computing:
+            done, _ = wait([*downloading, *computing], return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in downloading:
+                    ticker = downloading.pop(future)
+                    try:
+                        history = future.result()
+                    except Exception as error:
+                        print(f"Failed to download {ticker}: {error}")
+                        continue
+                    if profiling.enabled():
+                        future = compute.submit(profiling.call_in_worker, profiling.memory(), process, ticker, history)
+                    else:
+                        future = compute.submit(process, ticker, history)
+                    computing[future] = ticker
+                else:
+                    ticker = computing.pop(future)
+                    result = future.result()
+                    if profiling.enabled():
+                        result, records = result
+                        profiling.merge(records)
+                    yield ticker, result
+
+def _run_serial(tickers, process, download):
+    """run_pipeline in the calling thread, so cProfile sees every stage"""
+    for ticker in tickers:
+        try:
+            history = download(ticker)
+        except Exception as error:
+            print(f"Failed to download {ticker}: {error}")
+            continue
+        yield ticker, process(ticker, history)
@@ -1,18 +1,24 @@
-import os
 from datetime import datetime, timedelta
-import yfinance as yf
+from functools import partial
 import math
+import numpy as np
 from strategy import (
-    Strategy,
     TickerData,
-    Trade,
-    run_all_strategies,
+    scan_strategy,
     strategies,
 )
-from db import save_trade_to_db, create_table
+from db import save_trades, delete_trades, get_backfill_state, save_backfill_state
+from pipeline import run_pipeline
+from profiling import staged
 
-def backtest_and_populate_db(ticker_data, trades):
-    for trade in trades:
+@staged("settle")
+def settle_trades(ticker_data, trades):
+    """Trades whose expiration price is known, with their status set"""
+    settled_trades = []
+    expiration_prices = ticker_data.get_prices_asof(
+        [trade.expiration_date for trade in trades], max_days=0
+    )
+    for trade, expiration_price in zip(trades, expiration_prices):
         date_alerted = trade.date_alerted
         expiration_date = trade.expiration_date
         sell_strike = math.floor(float(trade.strike_price))  # Round down to nearest integer
@@ -22,9 +28,9 @@ def backtest_and_populate_db(ticker_data, trades):
         if expiration_date > datetime.now().date() or expiration_date.weekday() >= 5 or date_alerted.weekday() >= 5:
             continue
 
-        expiration_price = ticker_data.get_date_price(expiration_date)
-        if expiration_price is None:
+        if np.isnan(expiration_price):
             continue  # Skip this trade if we can't find a valid expiration price
+        expiration_price = float(expiration_price)
 
         if (option_type == "put" and sell_strike < expiration_price) or (
             option_type == "call" and sell_strike > float(expiration_price)
@@ -33,33 +39,82 @@ def backtest_and_populate_db(ticker_data, trades):
         else:
             status = "loss"
 
-        save_trade_to_db(trade, status)
+        trade.status = status
+        settled_trades.append(trade)
 
-def populate_historical_trades():
-    tickers = ["IWM", "VTI", "QQQ", "SPY"]
-    end_date = datetime.now().date()
-    start_date = end_date - timedelta(days=9000)
+    return settled_trades
+
+def backtest_and_populate_db(ticker_data, trades):
+    save_trades(settle_trades(ticker_data, trades))
 
-    for ticker_symbol in tickers:
-        print(f"Processing {ticker_symbol}...")
-        ticker_data = TickerData(ticker_symbol)
+def backfill_start(ticker_symbol, strategy, start_date):
+    """First alert date an incremental backfill of ticker_symbol and strategy has to scan"""
+    state = get_backfill_state(ticker_symbol, strategy.name)
+    if state is None:
+        return start_date
+    parameters, last_date = state
+    if parameters != strategy.signature():
+        print(f"{strategy.name} parameters changed, rebuilding {ticker_symbol}")
+        delete_trades(ticker_symbol, strategy.name)
+        return start_date
+    return max(start_date, datetime.strptime(last_date, '%Y-%m-%d').date() + timedelta(days=1))
 
-        all_trades = []
-        current_date = start_date
-        while current_date <= end_date:
-            trades = run_all_strategies(ticker_data, current_date, duplicate_filter=True)
-            if trades:  # Only extend if there are trades
-                all_trades.extend(trades)
-            current_date += timedelta(days=1)
+def backfill_mark(ticker_data, trades, end_date):
+    """
+    Last alert date that never has to be scanned again: the day before the
+    first alert still waiting for its expiration price, and never the last
+    session itself, whose bar may still change
+    """
+    last_session = ticker_data.dates[-1].astype(object)
+    mark = min(end_date, last_session - timedelta(days=1))
+    for trade in trades:
+        if trade.expiration_date > last_session:
+            mark = min(mark, trade.date_alerted - timedelta(days=1))
+    return mark
+
+def backfill_ticker(ticker_symbol, history, start_dates, end_date):
+    """
+    Scan and settle every strategy of one ticker, run in a worker process.
+    Returns the number of alerts found, the settled trades and the new
+    backfill mark of each strategy.
+    """
+    ticker_data = TickerData(ticker_symbol, history=history)
+    all_trades = []
+    marks = {}
+    for strategy in strategies:
+        trades = scan_strategy(ticker_data, strategy, start_dates[ticker_symbol][strategy.name], end_date)
+        marks[strategy.name] = backfill_mark(ticker_data, trades, end_date)
+        all_trades.extend(trades)
+    # Same order as scan_all_strategies: by date, then by strategy
+    all_trades.sort(key=lambda trade: trade.date_alerted)
+    return len(all_trades), settle_trades(ticker_data, all_trades), marks
+
+def populate_historical_trades(incremental=False, tickers=None):
+    tickers = tickers or ["IWM", "VTI", "QQQ", "SPY"]
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=9000)
 
+    start_dates = {
+        ticker_symbol: {
+            strategy.name: backfill_start(ticker_symbol, strategy, start_date) if incremental else start_date
+            for strategy in strategies
+        }
+        for ticker_symbol in tickers
+    }
 
-        if all_trades:  # Only process if we have trades
-            print(f"Found {len(all_trades)} trades for {ticker_symbol}")
-            backtest_and_populate_db(ticker_data, all_trades)
+    process = partial(backfill_ticker, start_dates=start_dates, end_date=end_date)
+    for ticker_symbol, (found, settled_trades, marks) in run_pipeline(tickers, process):
+        print(f"Processed {ticker_symbol}")
+        if found:  # Only process if we have trades
+            print(f"Found {found} trades for {ticker_symbol}")
+            save_trades(settled_trades)
         else:
             print(f"No trades found for {ticker_symbol}")
 
-        print(f"Finished processing {ticker_symbol}")
+        for strategy in strategies:
+            save_backfill_state(ticker_symbol, strategy.name, strategy.signature(), marks[strategy.name].strftime('%Y-%m-%d'))
+
+        print(f"Saved {ticker_symbol}")
 
     print("Database population complete.")
 
@@ -0,0 +1,68 @@
+"""
+Local stand-in for the price source. Serves the cached daily bars of a
+directory as CSV at /<TICKER>.csv?start=YYYY-MM-DD, optionally with an
+artificial delay per request. Point PRICE_SOURCE_URL at it to run the
+downloads without network access:
+
+    python scriptsv2/price_server.py --dir data/prices --port 8765 --delay 0.5
+    PRICE_SOURCE_URL=http://127.0.0.1:8765 PRICE_CACHE_DIR=/tmp/prices python scriptsv2/main.py backtest
+"""
+import argparse
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from price_cache import read_cache
+
+class PriceHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        ticker = os.path.basename(url.path).removesuffix(".csv")
+        history = read_cache(ticker, self.server.cache_dir)
+        if history is None:
+            self.send_error(404, f"Unknown ticker {ticker}")
+            return
+
+        start = parse_qs(url.query).get("start")
+        if start:
+            history = history[history.index >= start[0]]
+
+        time.sleep(self.server.delay)
+        body = history.to_csv(index_label="Date").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def make_server(cache_dir, host="127.0.0.1", port=0, delay=0.0):
+    server = ThreadingHTTPServer((host, port), PriceHandler)
+    server.daemon_threads = True
+    server.cache_dir = cache_dir
+    server.delay = delay
+    server.url = f"http://{host}:{server.server_address[1]}"
+    return server
+
+def start_server(cache_dir, host="127.0.0.1", port=0, delay=0.0):
+    """Serve cache_dir from a background thread, the base url is in server.url"""
+    server = make_server(cache_dir, host, port, delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve cached price histories as CSV")
+    parser.add_argument("--dir", required=True, help="Directory of cached <TICKER>.npz files")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before each response")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = make_server(args.dir, args.host, args.port, args.delay)
+    print(f"Serving {args.dir} on {server.url}")
+    server.serve_forever()
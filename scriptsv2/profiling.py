@@ -0,0 +1,208 @@
+"""
+Per-stage wall time, call counts and peak memory for main.py --profile.
+
+Code marks its stages with `with stage("name"):`, or whole functions with
+the @staged("name") decorator. While no profiler is running stage()
+returns a shared no-op context manager, so instrumented code pays a
+single function call. Stages that run in pipeline worker processes are
+recorded there and merged back into the parent's report.
+Peak memory is the tracemalloc peak of the process while the stage ran,
+so it is approximate when stages overlap on several threads.
+"""
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+_profiler = None
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    __slots__ = ("profiler", "name", "start", "child_peak", "profile")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        profiler = self.profiler
+        stack = profiler.stack()
+        self.child_peak = 0
+        if profiler.memory:
+            # Keep the peak reached so far in the enclosing stage before
+            # resetting it for this one
+            if stack:
+                stack[-1].child_peak = max(stack[-1].child_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        stack.append(self)
+
+        self.profile = None
+        # Only outermost stages of the main thread are profiled, cProfile cannot nest
+        if profiler.cprofile and len(stack) == 1 and threading.current_thread() is threading.main_thread():
+            self.profile = profiler.profiles.setdefault(self.name, cProfile.Profile())
+            self.profile.enable()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        if self.profile is not None:
+            self.profile.disable()
+
+        profiler = self.profiler
+        stack = profiler.stack()
+        stack.pop()
+        peak = 0
+        if profiler.memory:
+            peak = max(self.child_peak, tracemalloc.get_traced_memory()[1])
+            if stack:
+                stack[-1].child_peak = max(stack[-1].child_peak, peak)
+            profiler.peak = max(profiler.peak, peak)
+        profiler.add(self.name, 1, elapsed, peak)
+        return False
+
+class Profiler:
+    def __init__(self, memory=True, cprofile=False):
+        self.pid = os.getpid()
+        self.memory = memory
+        self.cprofile = cprofile
+        self.records = {}  # stage name -> [calls, seconds, peak memory]
+        self.profiles = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.perf_counter()
+        self.peak = 0
+        self.owns_tracemalloc = memory and not tracemalloc.is_tracing()
+        if self.owns_tracemalloc:
+            tracemalloc.start()
+
+    def stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def add(self, name, calls, seconds, peak):
+        with self.lock:
+            record = self.records.setdefault(name, [0, 0.0, 0])
+            record[0] += calls
+            record[1] += seconds
+            record[2] = max(record[2], peak)
+
+    def merge(self, records):
+        for name, (calls, seconds, peak) in records.items():
+            self.add(name, calls, seconds, peak)
+
+    def close(self):
+        if self.owns_tracemalloc:
+            tracemalloc.stop()
+
+def stage(name):
+    """Context manager timing one stage, a no-op unless a profiler is running"""
+    if _profiler is None:
+        return _NULL_STAGE
+    return _Stage(_profiler, name)
+
+def staged(name):
+    """Decorator timing every call of the function as stage name"""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def enabled():
+    return _profiler is not None
+
+def memory():
+    return _profiler is not None and _profiler.memory
+
+def serial():
+    """cProfile only sees the main thread, so the pipeline runs serially under it"""
+    return _profiler is not None and _profiler.cprofile
+
+def start(memory=True, cprofile=False):
+    global _profiler
+    _profiler = Profiler(memory, cprofile)
+    return _profiler
+
+def stop(action=None):
+    """Stop profiling, returns the report and the cProfile profiles of each stage"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is None:
+        return None
+
+    wall_time = time.perf_counter() - profiler.started
+    peak = max(profiler.peak, tracemalloc.get_traced_memory()[1]) if profiler.memory else None
+    profiler.close()
+
+    stages = {
+        name: {"calls": calls, "seconds": seconds, "peak_memory_bytes": peak_memory if profiler.memory else None}
+        for name, (calls, seconds, peak_memory) in sorted(
+            profiler.records.items(), key=lambda item: item[1][1], reverse=True
+        )
+    }
+    report = {
+        "action": action,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "wall_seconds": wall_time,
+        "peak_memory_bytes": peak,
+        "stages": stages,
+    }
+    return report, profiler.profiles
+
+def write_report(report, path):
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+
+def dump_hottest(report, profiles, path):
+    """Write the cProfile stats of the slowest profiled stage, returns its name"""
+    for name in report["stages"]:
+        if name in profiles:
+            profiles[name].dump_stats(path)
+            return name
+    return None
+
+def call_in_worker(memory, function, *args):
+    """
+    Run function in a pool worker. Returns (result, stage records) when the
+    worker is another process, whose stages the parent cannot see.
+    """
+    global _profiler
+    if _profiler is not None and _profiler.pid == os.getpid():
+        return function(*args), None
+
+    _profiler = Profiler(memory)
+    try:
+        return function(*args), _profiler.records
+    finally:
+        _profiler.close()
+        _profiler = None
+
+def merge(records):
+    if _profiler is not None and records:
+        _profiler.merge(records)
+
+def print_report(report):
+    print(f"\n=== Profile: {report['action']} ({report['wall_seconds']:.2f}s) ===")
+    print(f"{'Stage':<14} {'Calls':>8} {'Seconds':>10} {'Peak MB':>9}")
+    for name, record in report["stages"].items():
+        peak = record["peak_memory_bytes"]
+        peak = f"{peak / 2**20:>9.1f}" if peak is not None else f"{'-':>9}"
+        print(f"{name:<14} {record['calls']:>8} {record['seconds']:>10.3f} {peak}")
@@ -0,0 +1,169 @@
+"""
+Streaming rolling mean and standard deviation of daily closes.
+
+RollingStats keeps the dates, closes and rolling mean/std of a whole
+history in arrays that double their capacity when full, plus the running
+mean and sum of squared deviations of the last `window` closes. Appending
+a bar is a sliding-window Welford update: O(1) whatever the history
+length. The values match close.rolling(window).mean() / .std() (sample
+std, NaN until window closes are known and while a NaN close is inside
+the window). The accumulator is recomputed from the window every
+REFRESH_INTERVAL appends so rounding errors cannot build up.
+"""
+import os
+import numpy as np
+import pandas as pd
+
+REFRESH_INTERVAL = 1000
+MIN_CAPACITY = 256
+
+class RollingStats:
+    def __init__(self, window=200, capacity=MIN_CAPACITY):
+        self.window = window
+        self.size = 0
+        self._dates = np.empty(capacity, dtype="datetime64[D]")
+        self._close = np.empty(capacity)
+        self._ma = np.empty(capacity)
+        self._std = np.empty(capacity)
+        # Accumulator over the last `window` closes
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.nan_count = 0
+        self.since_refresh = 0
+
+    @property
+    def dates(self):
+        return self._dates[:self.size]
+
+    @property
+    def close(self):
+        return self._close[:self.size]
+
+    @property
+    def ma(self):
+        return self._ma[:self.size]
+
+    @property
+    def std(self):
+        return self._std[:self.size]
+
+    @classmethod
+    def from_closes(cls, dates, closes, window=200):
+        """Bulk build over a whole history, the rolling values come from pandas"""
+        closes = pd.Series(np.asarray(closes, dtype=float))
+        stats = cls(window, max(MIN_CAPACITY, 2 * len(closes)))
+        stats.size = len(closes)
+        stats._dates[:stats.size] = np.asarray(dates, dtype="datetime64[D]")
+        stats._close[:stats.size] = closes.to_numpy()
+        rolling_data = closes.rolling(window=window)
+        stats._ma[:stats.size] = rolling_data.mean().to_numpy()
+        stats._std[:stats.size] = rolling_data.std().to_numpy()
+        stats._refresh()
+        return stats
+
+    def _grow(self):
+        capacity = 2 * len(self._close)
+        for name in ("_dates", "_close", "_ma", "_std"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def _refresh(self):
+        """Recompute the accumulator exactly from the closes in the window"""
+        values = self._close[max(0, self.size - self.window):self.size]
+        self.nan_count = int(np.isnan(values).sum())
+        self.since_refresh = 0
+        if self.nan_count or len(values) == 0:
+            self.mean = self.m2 = 0.0
+            return
+        self.mean = float(values.mean())
+        self.m2 = float(((values - self.mean) ** 2).sum())
+
+    def _slide(self, new, old):
+        """Add new to the accumulator, removing old (None while the window fills)"""
+        old_is_nan = old is not None and np.isnan(old)
+        self.nan_count += int(np.isnan(new)) - int(old_is_nan)
+        if self.nan_count:
+            return
+        if old_is_nan or self.since_refresh >= REFRESH_INTERVAL:
+            # The last NaN just left the window, or the accumulator is due
+            self._refresh()
+            return
+
+        self.since_refresh += 1
+        if old is None:
+            count = min(self.size, self.window)
+            delta = new - self.mean
+            self.mean += delta / count
+            self.m2 += delta * (new - self.mean)
+        else:
+            old_mean = self.mean
+            self.mean += (new - old) / self.window
+            self.m2 += (new - old) * (new - self.mean + old - old_mean)
+        self.m2 = max(self.m2, 0.0)
+
+    def append(self, date, close):
+        """
+        Add the bar of date, or replace the last bar when date is the last
+        date held (a bar saved intraday). Dates must not go backwards.
+        """
+        date = np.datetime64(date, "D")
+        if self.size and date < self._dates[self.size - 1]:
+            raise ValueError(f"Bar of {date} is older than the last bar, {self._dates[self.size - 1]}")
+        if self.size and date == self._dates[self.size - 1]:
+            self.size -= 1
+            self._refresh()
+        if self.size == len(self._close):
+            self._grow()
+
+        index = self.size
+        self._dates[index] = date
+        self._close[index] = close
+        self.size += 1
+        old = self._close[index - self.window] if index >= self.window else None
+        self._slide(float(close), old)
+
+        full = self.size >= self.window and not self.nan_count
+        self._ma[index] = self.mean if full else np.nan
+        self._std[index] = np.sqrt(self.m2 / (self.window - 1)) if full else np.nan
+
+    def asof(self, date):
+        """(date, close, ma, std) of the last bar on or before date, None before the first bar"""
+        position = int(np.searchsorted(self.dates, np.datetime64(date, "D"), side="right")) - 1
+        if position < 0:
+            return None
+        return (self._dates[position], float(self._close[position]),
+                float(self._ma[position]), float(self._std[position]))
+
+    def to_dict(self):
+        """Arrays and accumulator state, for np.savez"""
+        return {
+            "window": np.int64(self.window),
+            "dates": self.dates, "close": self.close, "ma": self.ma, "std": self.std,
+            "accumulator": np.array([self.mean, self.m2, self.nan_count, self.since_refresh]),
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        size = len(state["close"])
+        stats = cls(int(state["window"]), max(MIN_CAPACITY, 2 * size))
+        stats.size = size
+        for name in ("dates", "close", "ma", "std"):
+            getattr(stats, "_" + name)[:size] = state[name]
+        mean, m2, nan_count, since_refresh = state["accumulator"]
+        stats.mean, stats.m2 = float(mean), float(m2)
+        stats.nan_count, stats.since_refresh = int(nan_count), int(since_refresh)
+        return stats
+
+    def save(self, path):
+        # Write to a temporary file first so an interrupted run never leaves a truncated state
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            np.savez(file, **self.to_dict())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as state:
+            return cls.from_dict(state)
@@ -0,0 +1,33 @@
+POSITION_CREDIT = 0.55
+KELLY_FRACTION = 0.3
+
+def kelly_parameters(win_rate=92.0, credit=POSITION_CREDIT, kelly_fraction=KELLY_FRACTION):
+    """Fraction of the bankroll to risk and the risk of one $5 wide spread"""
+    p = win_rate / 100
+    q = 1 - p
+    
+    win_amount = credit * 100 
+    loss_amount = (5 - credit) * 100
+    
+    b = win_amount / loss_amount
+    kelly = p - (q / b)
+    kelly = max(0, kelly) * kelly_fraction
+    return kelly, loss_amount
+
+# kelly criterion sizing
+def calculate_optimal_position(bankroll, win_rate=92.0):
+    credit = POSITION_CREDIT
+    kelly, loss_amount = kelly_parameters(win_rate, credit)
+    
+    optimal_risk = bankroll * kelly
+    num_spreads = int(optimal_risk / loss_amount)
+    num_spreads = max(1, min(num_spreads, 1000))
+    
+    return {
+        'credit': credit,
+        'num_spreads': num_spreads,
+        'potential_profit': num_spreads * (credit * 100 - 1),
+        'max_loss': num_spreads * (loss_amount + 1),
+        'risk_amount': optimal_risk,
+        'risk_percentage': kelly * 100
+    }
@@ -1,57 +1,85 @@
-import sqlite3
-from datetime import datetime, timedelta
-from collections import defaultdict
-import pandas as pd
 import numpy as np
-from db import get_all_trades
-from strategy import calculate_optimal_position
+from tradebook import TradeBook
+from profiling import staged
+from sizing import POSITION_CREDIT, calculate_optimal_position, kelly_parameters
 
-def calculate_yearly_stats(trades, initial_capital=5000):
-    yearly_stats = defaultdict(lambda: {
-        'trades': 0, 'wins': 0, 'losses': 0, 
-        'net_return': 0, 'skipped_trades': 0
-    })
-    
+def equity_curve(wins, initial_capital=5000, win_rate=92.0):
+    """
+    Replay a chronological win/loss sequence with the position sizing of
+    calculate_optimal_position. After a loss, further losses are skipped
+    until the next win, which is taken. Returns boolean taken and float
+    pnl and equity arrays aligned with wins; a skipped trade has no pnl and
+    keeps the previous capital. A loss costs half the maximum loss.
+    """
+    wins = np.asarray(wins, dtype=bool)
+    taken = np.ones(len(wins), dtype=bool)
+    taken[1:] = wins[1:] | wins[:-1]
+
+    kelly, loss_amount = kelly_parameters(win_rate)
+    spread_profit = POSITION_CREDIT * 100 - 1
+    spread_max_loss = loss_amount + 1
+
+    # Each position size depends on the capital left by the previous trade,
+    # so this is the one sequential pass
+    pnl = np.zeros(len(wins))
     running_capital = initial_capital
-    waiting_for_win = False
-    
-    for trade in trades:
-        year = datetime.strptime(trade[4], '%Y-%m-%d').strftime('%Y')
-        
-        if waiting_for_win:
-            if trade[8] == 'win':
-                waiting_for_win = False
-            else:
-                yearly_stats[year]['skipped_trades'] += 1
-                continue
-                
-        position = calculate_optimal_position(running_capital)
-        yearly_stats[year]['trades'] += 1
-        
-        if trade[8] == 'win':
-            yearly_stats[year]['wins'] += 1
-            profit = position['potential_profit']
-            yearly_stats[year]['net_return'] += profit
-            running_capital += profit
-        else:
-            yearly_stats[year]['losses'] += 1
-            loss = position['max_loss']/2
-            yearly_stats[year]['net_return'] -= loss
-            running_capital -= loss
-            waiting_for_win = True
-        
-        yearly_stats[year]['year_end_capital'] = running_capital
-    
-    for year_stats in yearly_stats.values():
-        total_actual_trades = year_stats['wins'] + year_stats['losses']
-        year_stats['win_rate'] = (year_stats['wins'] / total_actual_trades * 100) \
-            if total_actual_trades > 0 else 0
-        year_stats['total_trades_available'] = total_actual_trades + year_stats['skipped_trades']
-    
-    return yearly_stats, running_capital
+    for index, win in zip(np.flatnonzero(taken).tolist(), wins[taken].tolist()):
+        num_spreads = max(1, min(int(running_capital * kelly / loss_amount), 1000))
+        change = num_spreads * spread_profit if win else -(num_spreads * spread_max_loss / 2)
+        pnl[index] = change
+        running_capital += change
+
+    equity = np.cumsum(np.concatenate(([initial_capital], pnl)))[1:]
+    return taken, pnl, equity
+
+def drawdown_pct(equity, initial_capital):
+    """Percentage below the running peak of capital after every trade"""
+    curve = np.concatenate(([initial_capital], equity))
+    peaks = np.maximum.accumulate(curve)
+    return ((peaks - curve) / peaks * 100)[1:]
+
+def calculate_yearly_stats(trades, initial_capital=5000):
+    """
+    Per-year results of a TradeBook replayed in date order, returned with
+    the final capital, the equity curve and its drawdowns.
+    """
+    order = np.lexsort((trades.id, trades.date_alerted))
+    wins = trades.is_status('win')[order]
+    years = trades.years()[order]
+
+    taken, pnl, equity = equity_curve(wins, initial_capital)
+    drawdowns = drawdown_pct(equity, initial_capital)
+
+    labels, starts, groups = np.unique(years, return_index=True, return_inverse=True)
+    ends = np.append(starts[1:], len(years)) - 1
+    trade_counts = np.bincount(groups, taken, len(labels)).astype(int)
+    win_counts = np.bincount(groups, taken & wins, len(labels)).astype(int)
+    skipped_counts = np.bincount(groups, ~taken, len(labels)).astype(int)
+    net_returns = np.bincount(groups, pnl, len(labels))
+    max_drawdowns = np.maximum.reduceat(drawdowns, starts) if len(starts) else drawdowns
+
+    yearly_stats = {}
+    for i, year in enumerate(labels.tolist()):
+        trade_count = int(trade_counts[i])
+        yearly_stats[str(year)] = {
+            'trades': trade_count,
+            'wins': int(win_counts[i]),
+            'losses': trade_count - int(win_counts[i]),
+            'net_return': float(net_returns[i]),
+            'skipped_trades': int(skipped_counts[i]),
+            # Skipped trades keep the capital, so the last row holds the year end
+            'year_end_capital': float(equity[ends[i]]),
+            'max_drawdown': float(max_drawdowns[i]),
+            'win_rate': (win_counts[i] / trade_count * 100) if trade_count > 0 else 0,
+            'total_trades_available': trade_count + int(skipped_counts[i]),
+        }
+
+    final_capital = float(equity[-1]) if len(equity) else initial_capital
+    return yearly_stats, final_capital, equity, drawdowns
 
+@staged("stats")
 def calculate_statistics(trades, initial_capital=5000):
-    yearly_stats, final_capital = calculate_yearly_stats(trades, initial_capital)
+    yearly_stats, final_capital, equity, drawdowns = calculate_yearly_stats(trades, initial_capital)
     
     total_trades = sum(year['trades'] for year in yearly_stats.values())
     total_wins = sum(year['wins'] for year in yearly_stats.values())
@@ -67,6 +95,8 @@ def calculate_statistics(trades, initial_capital=5000):
         'initial_capital': initial_capital,
         'final_capital': final_capital,
         'total_return_pct': ((final_capital - initial_capital) / initial_capital) * 100,
+        'max_drawdown_pct': float(drawdowns.max(initial=0)),
+        'equity_curve': equity,
         'current_optimal_position': calculate_optimal_position(final_capital)
     }
 
@@ -81,10 +111,11 @@ def print_statistics(stats):
     print(f"Initial Capital: ${stats['initial_capital']:,.2f}")
     print(f"Final Capital: ${stats['final_capital']:,.2f}")
     print(f"Total Return: {stats['total_return_pct']:.1f}%")
+    print(f"Max Drawdown: {stats['max_drawdown_pct']:.1f}%")
     
     print("\n=== Yearly Performance ===")
-    print("Year\t\tTrades\tSkipped\tWin Rate\tCapital\t\tYearly Change")
-    print("-" * 80)
+    print("Year\t\tTrades\tSkipped\tWin Rate\tCapital\t\tYearly Change\tDrawDown")
+    print("-" * 90)
     
     prev_capital = stats['initial_capital']
     
@@ -97,7 +128,8 @@ def print_statistics(stats):
               f"{year_stats['skipped_trades']}\t"
               f"{year_stats['win_rate']:>6.1f}%\t"
               f"${year_end_capital:>11,.0f}\t"
-              f"${yearly_change:>+11,.0f}")
+              f"${yearly_change:>+11,.0f}\t"
+              f"{year_stats['max_drawdown']:>6.1f}%")
         
         prev_capital = year_end_capital
     
@@ -111,7 +143,7 @@ def print_statistics(stats):
     print(f"Potential Profit: ${current_position['potential_profit']:,.2f}")
 
 def main():
-    trades = get_all_trades(["SPY"])[-300:]
+    trades = TradeBook.from_db(["SPY"], last_n=300)
     stats = calculate_statistics(trades, 20000)
     print_statistics(stats)
 
@@ -1,14 +1,22 @@
 import os
+import json
 from datetime import datetime, timedelta
-import telebot
-import yfinance as yf
+from functools import partial
 from dotenv import load_dotenv
 import math
+import numpy as np
 import pandas as pd
 
 load_dotenv()
 environment = os.environ.get("ENV")
-from db import save_trade_to_db, get_trades_for_streak
+from db import save_trades, get_trades_for_streak
+from price_cache import load_history, merge_bars
+from pipeline import run_pipeline
+from trading_calendar import EXPIRATION_RULE, expiration_sessions
+from profiling import stage, staged
+from rolling import RollingStats
+from sizing import calculate_optimal_position
+from notifier import get_notifier
 
 class Strategy:
     def __init__(
@@ -25,6 +33,16 @@ class Strategy:
         self.price_multiplier = price_multiplier
         self.expiration_date_round = expiration_date_round
 
+    def signature(self):
+        # Stored with the backfill marks, a change forces a rebuild
+        return json.dumps({
+            "option_type": self.option_type,
+            "deviation": self.deviation,
+            "price_multiplier": self.price_multiplier,
+            "expiration_date_round": self.expiration_date_round,
+            "expiration_rule": EXPIRATION_RULE,
+        }, sort_keys=True)
+
 strategies = [
     Strategy(
         "Trend Up",
@@ -43,27 +61,122 @@ strategies = [
 ]
 
 class TickerData:
-    def __init__(self, ticker):
+    def __init__(self, ticker, history=None, rolling=None):
         self.ticker = ticker
-        self.ticker_data = yf.download(ticker)
-        self.ticker_data.index = self.ticker_data.index.tz_localize(None)
+        self.ticker_data = load_history(ticker) if history is None else history
+        if rolling is None or not self.resume(rolling):
+            self.calculate_indicators()
+
+    def calculate_indicators(self, window=200):
+        with stage("indicators"):
+            # Rolling windows only look backwards, so the value at each row equals
+            # the one obtained by slicing the history up to that date.
+            self.rolling = RollingStats.from_closes(self.ticker_data.index.values, self._close(), window)
+
+    def resume(self, rolling, window=200):
+        """
+        Take over rolling statistics saved for an earlier state of this
+        history and append the bars after them. False when they do not
+        match the history or were computed over another window.
+        """
+        dates = self.ticker_data.index.values.astype("datetime64[D]")
+        closes = self._close().to_numpy(dtype=float)
+        held = rolling.size
+        if rolling.window != window or held == 0 or held > len(dates) or dates[held - 1] != rolling.dates[-1] \
+                or not np.array_equal(closes[held - 1], rolling.close[-1], equal_nan=True):
+            return False
+
+        self.rolling = rolling
+        with stage("indicators"):
+            for date, close in zip(dates[held:], closes[held:]):
+                rolling.append(date, close)
+        return True
+
+    def append_bars(self, new_bars):
+        """
+        Add bars fetched after the history was loaded, the first of which
+        may replace the last bar held. The rolling statistics are updated in
+        O(1) per bar.
+        """
+        if new_bars.empty:
+            return
+        self.ticker_data = merge_bars(self.ticker_data, new_bars)
+        if np.datetime64(new_bars.index[0], "D") < self.rolling.dates[-1]:
+            # Bars rewritten further back, recompute everything
+            self.calculate_indicators(self.rolling.window)
+            return
+
+        closes = self._close().to_numpy(dtype=float)[-len(new_bars):]
+        with stage("indicators"):
+            for date, close in zip(new_bars.index.values, closes):
+                self.rolling.append(date, close)
+
+    def _close(self):
+        close = self.ticker_data["Close"]
+        if isinstance(close, pd.DataFrame):
+            close = close.iloc[:, 0]
+        return close
+
+    @property
+    def dates(self):
+        return self.rolling.dates
+
+    @property
+    def close(self):
+        return self.rolling.close
+
+    @property
+    def ma(self):
+        return self.rolling.ma
+
+    @property
+    def std(self):
+        return self.rolling.std
+
+    def find_sessions(self, dates, direction="backward", max_days=None):
+        """
+        Index of the trading day on or before ("backward") or on or after
+        ("forward") each date, -1 where there is none within max_days.
+        """
+        days = np.asarray(dates, dtype="datetime64[D]")
+        if direction == "backward":
+            positions = np.searchsorted(self.dates, days, side="right") - 1
+        else:
+            positions = np.searchsorted(self.dates, days, side="left")
+
+        found = (positions >= 0) & (positions < len(self.dates))
+        if max_days is not None:
+            sessions = self.dates[np.clip(positions, 0, len(self.dates) - 1)]
+            found &= abs(sessions - days) <= np.timedelta64(max_days, "D")
+        return np.where(found, positions, -1)
+
+    def get_prices_asof(self, dates, direction="backward", max_days=None):
+        """Batch version of get_price_on_or_before/after, NaN where no session qualifies"""
+        positions = self.find_sessions(dates, direction, max_days)
+        return np.where(positions >= 0, self.close[positions], np.nan)
+
+    def _session_price(self, date, direction, max_days):
+        position = self.find_sessions(date, direction, max_days)
+        if position < 0:
+            return None, None
+        return self.dates[position].astype(object), float(self.close[position])
+
+    def get_price_on_or_before(self, date, max_days=None):
+        """(session date, close) of the last trading day on or before date"""
+        return self._session_price(date, "backward", max_days)
+
+    def get_price_on_or_after(self, date, max_days=None):
+        """(session date, close) of the first trading day on or after date"""
+        return self._session_price(date, "forward", max_days)
 
     def get_date_price(self, date):
-        try:
-            date_str = date.strftime("%Y-%m-%d")
-            return float(self.ticker_data.loc[date_str]["Close"])
-        except KeyError:
-            return None
+        return self._session_price(date, "backward", 0)[1]
 
     def calculate_ma_std(self, date):
-        try:
-            date_str = date.strftime("%Y-%m-%d")
-            rolling_data = self.ticker_data["Close"].loc[:date_str].rolling(window=200)
-            ma = rolling_data.mean().iloc[-1]
-            std = rolling_data.std().iloc[-1]
-            return ma, std
-        except (KeyError, IndexError):
+        position = self.find_sessions(date)
+        if position < 0:
             return None, None
+        return self.ma[position], self.std[position]
 
 class Trade:
     def __init__(
@@ -86,62 +199,121 @@ class Trade:
         self.strike_price = strike_price
         self.status = status
 
-def check_strategy(ticker, specific_date, strategy):
-    trades = []
-    for i in range(5):
-        date_alerted = specific_date - timedelta(days=i)
-        if date_alerted.weekday() >= 5:
-            continue
-
-        current_price = ticker.get_date_price(date_alerted)
-        if current_price is None:
-            continue
-
-        if isinstance(current_price, (pd.Series, pd.DataFrame)):
-            current_price = float(current_price)
-
-        ma, std = ticker.calculate_ma_std(date_alerted)
-        if ma is None or std is None:
-            continue
+LOOKBACK_DAYS = 5
 
-        upper_boundary = float(ma + strategy.deviation["up"] * std)
-        lower_boundary = float(ma + strategy.deviation["down"] * std)
-
-        if lower_boundary <= current_price <= upper_boundary:
-            strike_price = current_price * strategy.price_multiplier
-            sell_strike = math.floor(strike_price/5)*5 
+class FeatureFrame:
+    """
+    Close, MA, STD and z-score of a ticker on the sessions among the
+    LOOKBACK_DAYS days up to specific_date, newest first. Built once per
+    ticker and date, then shared by every strategy, each of which is a
+    mask over it.
+    """
 
-            expiration_date = date_alerted + timedelta(days=strategy.expiration_date_round)
-            while expiration_date.weekday() != 4:  # Find next Friday
-                expiration_date += timedelta(days=1)
+    def __init__(self, ticker_data, specific_date, lookback=LOOKBACK_DAYS):
+        self.ticker = ticker_data.ticker
+        dates = [specific_date - timedelta(days=i) for i in range(lookback)]
+        dates = [date for date in dates if date.weekday() < 5]
+        positions = ticker_data.find_sessions(dates, max_days=0) if dates else np.empty(0, dtype=int)
+        self.dates = [date for date, position in zip(dates, positions) if position >= 0]
+        positions = positions[positions >= 0]
+
+        self.close = ticker_data.close[positions]
+        self.ma = ticker_data.ma[positions]
+        self.std = ticker_data.std[positions]
+        self.closes = self.close.tolist()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.z = (self.close - self.ma) / self.std
+        self._expirations = {}
+
+    def masks(self, strategies):
+        """(strategies, dates) array, True where the close is inside a strategy's band"""
+        up = np.array([[strategy.deviation["up"]] for strategy in strategies], dtype=float)
+        down = np.array([[strategy.deviation["down"]] for strategy in strategies], dtype=float)
+        # Same boundaries as ma + deviation * std date by date, so ties resolve identically
+        upper_boundary = self.ma + up * self.std
+        lower_boundary = self.ma + down * self.std
+        return (lower_boundary <= self.close) & (self.close <= upper_boundary)
+
+    def strikes(self, strategies):
+        """(strategies, dates) array of sell strikes"""
+        multipliers = np.array([[strategy.price_multiplier] for strategy in strategies], dtype=float)
+        return np.floor(self.close * multipliers / 5) * 5
+
+    def expirations(self, days_to_expiration):
+        """
+        Expiration of every date for one rounding, as a datetime64[D] array
+        and as a list of the type of the dates
+        """
+        if days_to_expiration not in self._expirations:
+            sessions = expiration_sessions(self.dates, days_to_expiration)
+            offsets = (sessions - np.array(self.dates, dtype="datetime64[D]")).astype(np.int64).tolist()
+            self._expirations[days_to_expiration] = sessions, [
+                date + timedelta(days=offset) for date, offset in zip(self.dates, offsets)
+            ]
+        return self._expirations[days_to_expiration]
+
+    def trade(self, strategy, index):
+        """Trade idea of strategy on the date at index"""
+        current_price = self.closes[index]
+        strike_price = current_price * strategy.price_multiplier
+        return Trade(
+            ticker=self.ticker,
+            strategy_name=strategy.name,
+            current_price=current_price,
+            date_alerted=self.dates[index],
+            # Next Friday, or the session before it on exchange holidays
+            expiration_date=self.expirations(strategy.expiration_date_round)[1][index],
+            option_type=strategy.option_type,
+            strike_price=math.floor(strike_price/5)*5,
+        )
 
-            trade = Trade(
-                ticker=ticker.ticker,
-                strategy_name=strategy.name,
-                current_price=current_price,
-                date_alerted=date_alerted,
-                expiration_date=expiration_date,
-                option_type=strategy.option_type,
-                strike_price=sell_strike,
-            )
-            trades.append(trade)
+    def trades(self, strategy, mask=None):
+        """Trade ideas of strategy, newest first"""
+        if mask is None:
+            mask = self.masks([strategy])[0]
+        return [self.trade(strategy, index) for index in np.flatnonzero(mask)]
 
-    return trades
+def check_strategy(ticker, specific_date, strategy):
+    return FeatureFrame(ticker, specific_date).trades(strategy)
 
+def evaluate_signals(ticker_data, specific_date, strategy_list=None):
+    """
+    (filtered, unfiltered) trades of every strategy (all registered ones
+    by default) on specific_date: the results of run_all_strategies with
+    and without duplicate_filter, from a single FeatureFrame. Trade
+    objects are only built for the strategies that alert on specific_date.
+    """
+    strategy_list = strategies if strategy_list is None else strategy_list
+    with stage("signals"):
+        features = FeatureFrame(ticker_data, specific_date)
+        # Only an alert on specific_date itself can come out of either list
+        if not strategy_list or not features.dates or features.dates[0] != specific_date:
+            return [], []
+
+        masks = features.masks(strategy_list)
+        strikes = features.strikes(strategy_list)
+        rounding = np.array([strategy.expiration_date_round for strategy in strategy_list])
+        expirations = np.empty(masks.shape, dtype="datetime64[D]")
+        for days_to_expiration in np.unique(rounding).tolist():
+            expirations[rounding == days_to_expiration] = features.expirations(days_to_expiration)[0]
+
+        # remove_duplicates: the alert is dropped when the closest earlier alert
+        # with the same expiration is within $10 of its strike
+        alerted = masks[:, 0]
+        kept = alerted.copy()
+        pending = alerted.copy()
+        for column in range(1, masks.shape[1]):
+            duplicate = pending & masks[:, column] & (expirations[:, column] == expirations[:, 0])
+            kept[duplicate] = np.abs(strikes[duplicate, column] - strikes[duplicate, 0]) > 10
+            pending &= ~duplicate
+
+        trades = [features.trade(strategy_list[row], 0) for row in np.flatnonzero(alerted)]
+        filtered_trades = [trade for trade, keep in zip(trades, kept[alerted]) if keep]
+        return filtered_trades, trades
 
 def run_all_strategies(ticker_data, specific_date, duplicate_filter=True):
-    all_trades = []
-    for strategy in strategies:
-        trade_ideas = check_strategy(ticker_data, specific_date, strategy)
-        if duplicate_filter:
-            filtered_trade = remove_duplicates(trade_ideas, specific_date)
-            if filtered_trade:
-                all_trades.append(filtered_trade)
-        else:
-            for trade_idea in trade_ideas:
-                if trade_idea.date_alerted == specific_date:
-                    all_trades.append(trade_idea)
-    return all_trades
+    filtered_trades, trades = evaluate_signals(ticker_data, specific_date)
+    return filtered_trades if duplicate_filter else trades
 
 
 def remove_duplicates(trades, date_limit):
@@ -167,6 +339,64 @@ def remove_duplicates(trades, date_limit):
 
     return oldest_trade
 
+@staged("signals")
+def scan_strategy(ticker_data, strategy, start_date, end_date):
+    """
+    Whole-history equivalent of calling run_all_strategies with
+    duplicate_filter=True for every calendar day from start_date to end_date,
+    restricted to a single strategy.
+    """
+    dates = ticker_data.dates
+    close = ticker_data.close
+    weekdays = (dates.astype("int64") + 3) % 7  # 1970-01-01 was a Thursday
+
+    upper_boundary = ticker_data.ma + strategy.deviation["up"] * ticker_data.std
+    lower_boundary = ticker_data.ma + strategy.deviation["down"] * ticker_data.std
+    alerts = np.flatnonzero(
+        (weekdays < 5) & (lower_boundary <= close) & (close <= upper_boundary)
+    )
+
+    alert_dates = dates[alerts]
+    strikes = np.floor(close[alerts] * strategy.price_multiplier / 5) * 5
+
+    expiration_dates = expiration_sessions(alert_dates, strategy.expiration_date_round)
+
+    # remove_duplicates keeps an alert unless the previous alert inside the
+    # 5-day lookback shares its expiration and sits within $10 of its strike
+    keep = np.ones(len(alerts), dtype=bool)
+    keep[1:] = (
+        (np.diff(alert_dates).astype("int64") > 4)
+        | (expiration_dates[1:] != expiration_dates[:-1])
+        | (np.abs(np.diff(strikes)) > 10)
+    )
+    keep &= (alert_dates >= np.datetime64(start_date, "D")) & (alert_dates <= np.datetime64(end_date, "D"))
+
+    return [
+        Trade(
+            ticker=ticker_data.ticker,
+            strategy_name=strategy.name,
+            current_price=float(close[position]),
+            date_alerted=date_alerted,
+            expiration_date=expiration_date,
+            option_type=strategy.option_type,
+            strike_price=int(strike),
+        )
+        for position, date_alerted, expiration_date, strike in zip(
+            alerts[keep],
+            alert_dates[keep].tolist(),
+            expiration_dates[keep].tolist(),
+            strikes[keep],
+        )
+    ]
+
+def scan_all_strategies(ticker_data, start_date, end_date):
+    all_trades = []
+    for strategy in strategies:
+        all_trades.extend(scan_strategy(ticker_data, strategy, start_date, end_date))
+    # Same order as the day-by-day loop: by date, then by strategy
+    all_trades.sort(key=lambda trade: trade.date_alerted)
+    return all_trades
+
 def get_trading_status(date_str):
     trades = get_trades_for_streak(date_str)
     if not trades:
@@ -183,31 +413,6 @@ def get_trading_status(date_str):
     
     return False, "Active", win_streak_start
 
-# kelly criterion sizing
-def calculate_optimal_position(bankroll, win_rate=92.0):
-    p = win_rate / 100
-    q = 1 - p
-    
-    credit = 0.55
-    win_amount = credit * 100 
-    loss_amount = (5 - credit) * 100
-    
-    b = win_amount / loss_amount
-    kelly = p - (q / b)
-    kelly = max(0, kelly) * 0.3
-    
-    optimal_risk = bankroll * kelly
-    num_spreads = int(optimal_risk / loss_amount)
-    num_spreads = max(1, min(num_spreads, 1000))
-    
-    return {
-        'credit': credit,
-        'num_spreads': num_spreads,
-        'potential_profit': num_spreads * (credit * 100 - 1),
-        'max_loss': num_spreads * (loss_amount + 1),
-        'risk_amount': optimal_risk,
-        'risk_percentage': kelly * 100
-    }
 def check_winning_streak(trades):
     if not trades:
         return True, None  # No trades means we can trade
@@ -264,44 +469,56 @@ def generate_alert(current_price, trades, current_year, bankroll=5000, is_active
     print(output)
     
     if environment == "PROD":
-        bot = telebot.TeleBot(os.environ.get("TELEGRAM_TOKEN"))
-        bot.send_message(os.environ.get("TELEGRAM_CHAT_ID"), output)
+        # Sent in the background by flush_alerts, coalesced with the other alerts of the run
+        get_notifier().send(output)
+
+def flush_alerts():
+    """Send the alerts queued so far and wait until Telegram has them"""
+    if environment == "PROD":
+        with stage("telegram"):
+            get_notifier().flush()
+
+def compute_signals(ticker_name, history, specific_date):
+    """Filtered trades, every trade idea and the price of specific_date, run in a worker process"""
+    ticker = TickerData(ticker_name, history=history)
+    filtered_trades, trades = evaluate_signals(ticker, specific_date)
+    return filtered_trades, trades, ticker.get_date_price(specific_date)
+
+def alert_signals(ticker_name, filtered_trades, trades, current_price, specific_date, bankroll):
+    """Store the filtered trades of specific_date and alert every trade idea"""
+    streak_trades = get_trades_for_streak(ticker_name, specific_date.strftime('%Y-%m-%d'))
+    current_year_winrate = calculate_current_year_winrate(streak_trades, specific_date.year)
+
+    # Check if we can trade based on streak
+    can_trade, last_trade_date = check_winning_streak(streak_trades)
+    
+    # First save filtered trades to DB
+    if filtered_trades:
+        save_trades(filtered_trades)  # Saved with null status for later update
+    
+    # Then generate alerts for all possible trades
+    generate_alert(current_price, trades, current_year_winrate, bankroll, is_active=can_trade)
+
+TICKERS = [
+    # "VTI",
+    # "IWM", 
+    "SPY",
+    # "QQQ",
+]
+BANKROLL = 20000
 
 def main():
-    tickers = [
-        # "VTI",
-        # "IWM", 
-        "SPY",
-        # "QQQ",
-    ]
-    bankroll = 20000
+    tickers = TICKERS
+    bankroll = BANKROLL
 
     specific_date = datetime.now().date()
     # specific_date = datetime(2022, 10, 7)
     # specific_date = datetime(2024, 11, 27)
 
-    
-    for ticker_name in tickers:
-        ticker = TickerData(ticker_name)
-        
-        trades = get_trades_for_streak(ticker_name, specific_date.strftime('%Y-%m-%d'))
-        current_year_winrate = calculate_current_year_winrate(trades, specific_date.year)
-
-        # Check if we can trade based on streak
-        can_trade, last_trade_date = check_winning_streak(trades)
-        
-        # First save filtered trades to DB
-        filtered_trades = run_all_strategies(ticker, specific_date, duplicate_filter=True)
-        if filtered_trades:
-            for trade in filtered_trades:
-                save_trade_to_db(trade, None)  # Save with null status for later update
-        
-        # Then generate alerts for all possible trades
-        trades = run_all_strategies(ticker, specific_date, duplicate_filter=False)
-        
-
-        current_price = ticker.get_date_price(specific_date)
-        generate_alert(current_price, trades, current_year_winrate, bankroll, is_active=can_trade)
+    process = partial(compute_signals, specific_date=specific_date)
+    for ticker_name, (filtered_trades, trades, current_price) in run_pipeline(tickers, process):
+        alert_signals(ticker_name, filtered_trades, trades, current_price, specific_date, bankroll)
+    flush_alerts()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,169 @@
+from itertools import islice
+import numpy as np
+from db import iter_trades
+
+# Column order of the trades table
+COLUMNS = ("id", "ticker", "strategy_name", "current_price", "date_alerted",
+           "expiration_date", "option_type", "strike_price", "status")
+CATEGORICAL = ("ticker", "strategy_name", "option_type", "status")
+DTYPES = {
+    "id": np.int64,
+    "current_price": np.float64,
+    "date_alerted": "datetime64[D]",
+    "expiration_date": "datetime64[D]",
+    "strike_price": np.float64,
+}
+CODE_DTYPE = np.int16
+CHUNK_SIZE = 10000
+
+class TradeView:
+    """One row of a TradeBook, read through the same attributes as a Trade"""
+    __slots__ = ("book", "index")
+
+    def __init__(self, book, index):
+        self.book = book
+        self.index = index
+
+    def __repr__(self):
+        return f"TradeView({', '.join(f'{name}={getattr(self, name)!r}' for name in COLUMNS)})"
+
+def _column_property(name):
+    return property(lambda view: view.book.value(name, view.index))
+
+for _name in COLUMNS:
+    setattr(TradeView, _name, _column_property(_name))
+
+class TradeBook:
+    """
+    Trades stored column-wise: integer ids, datetime64[D] dates, float
+    prices and strikes, and int16 codes into per-column category lists for
+    ticker, strategy, option type and status (None included).
+
+    Rows are always sorted by ticker, date alerted and id, so the trades of
+    one ticker, and a date range within it, are contiguous slices that share
+    memory with the book they were taken from.
+    """
+    __slots__ = ("columns", "categories")
+
+    def __init__(self, columns, categories):
+        self.columns = columns
+        self.categories = categories
+
+    def __getattr__(self, name):
+        if name in COLUMNS:
+            return self.columns[name]
+        raise AttributeError(name)
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return TradeView(self, range(len(self))[key])
+        # Slices are views, boolean and index arrays copy
+        return TradeBook({name: column[key] for name, column in self.columns.items()}, self.categories)
+
+    def __iter__(self):
+        return (TradeView(self, index) for index in range(len(self)))
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+    def value(self, name, index):
+        """Python value of one cell, as a Trade would hold it"""
+        value = self.columns[name][index]
+        if name in CATEGORICAL:
+            return self.categories[name][value]
+        if name in ("date_alerted", "expiration_date"):
+            return value.astype(object)
+        return value.item()
+
+    def code(self, name, label):
+        """Code of label in a categorical column, -1 when it never occurs"""
+        try:
+            return self.categories[name].index(label)
+        except ValueError:
+            return -1
+
+    def is_status(self, status):
+        return self.columns["status"] == self.code("status", status)
+
+    def years(self):
+        return self.columns["date_alerted"].astype("datetime64[Y]").astype(np.int64) + 1970
+
+    def for_ticker(self, ticker):
+        """Zero-copy slice with the trades of one ticker"""
+        tickers = self.columns["ticker"]
+        code = self.code("ticker", ticker)
+        return self[np.searchsorted(tickers, code, "left"):np.searchsorted(tickers, code, "right")]
+
+    def between(self, start_date=None, end_date=None):
+        """
+        Trades alerted from start_date to end_date inclusive. A zero-copy
+        slice when the book holds a single ticker, a copy otherwise.
+        """
+        dates = self.columns["date_alerted"]
+        start = np.datetime64(start_date or "NaT", "D")
+        end = np.datetime64(end_date or "NaT", "D")
+
+        tickers = self.columns["ticker"]
+        if len(self) == 0 or tickers[0] == tickers[-1]:
+            first = np.searchsorted(dates, start, "left") if start_date else 0
+            last = np.searchsorted(dates, end, "right") if end_date else len(self)
+            return self[first:last]
+
+        mask = np.ones(len(self), dtype=bool)
+        if start_date:
+            mask &= dates >= start
+        if end_date:
+            mask &= dates <= end
+        return self[mask]
+
+    @classmethod
+    def from_rows(cls, rows, chunk_size=CHUNK_SIZE):
+        """Build a book from rows in the column order of the trades table, chunk_size rows at a time"""
+        rows = iter(rows)
+        lookups = {name: {} for name in CATEGORICAL}
+        parts = {name: [] for name in COLUMNS}
+
+        while chunk := list(islice(rows, chunk_size)):
+            for name, values in zip(COLUMNS, zip(*chunk)):
+                if name in CATEGORICAL:
+                    lookup = lookups[name]
+                    codes = [lookup.setdefault(value, len(lookup)) for value in values]
+                    parts[name].append(np.array(codes, dtype=CODE_DTYPE))
+                else:
+                    parts[name].append(np.array(values, dtype=DTYPES[name]))
+
+        columns = {
+            name: np.concatenate(parts[name]) if parts[name]
+            else np.empty(0, dtype=CODE_DTYPE if name in CATEGORICAL else DTYPES[name])
+            for name in COLUMNS
+        }
+
+        # Renumber the categories in sorted order (None first), so that ticker
+        # codes sort like the ticker names
+        categories = {}
+        for name in CATEGORICAL:
+            labels = sorted(lookups[name], key=lambda label: (label is not None, label or ""))
+            remap = np.array([labels.index(label) for label in lookups[name]], dtype=CODE_DTYPE)
+            columns[name] = remap[columns[name]] if len(remap) else columns[name]
+            categories[name] = labels
+
+        order = np.lexsort((columns["id"], columns["date_alerted"], columns["ticker"]))
+        return cls({name: column[order] for name, column in columns.items()}, categories)
+
+    @classmethod
+    def from_trades(cls, trades):
+        """Build a book from Trade objects, ids follow their order"""
+        return cls.from_rows(
+            (index, trade.ticker, trade.strategy_name, trade.current_price, trade.date_alerted,
+             trade.expiration_date, trade.option_type, trade.strike_price, trade.status)
+            for index, trade in enumerate(trades, 1)
+        )
+
+    @classmethod
+    def from_db(cls, ticker_list, start_date_str=None, end_date_str=None, last_n=None):
+        """Build a book straight from the trades table, see db.iter_trades"""
+        return cls.from_rows(iter_trades(ticker_list, start_date_str, end_date_str, last_n))
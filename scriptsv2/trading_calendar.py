@@ -0,0 +1,158 @@
+"""
+NYSE trading calendar built from the exchange holiday rules.
+
+The table covers FIRST_YEAR to LAST_YEAR and is built once, on first use.
+Besides the sessions it stores, for every calendar day, the expiration
+session of a weekly option whose expiration is that day rounded to the
+next Friday: the Friday itself, or the last session before it when the
+exchange is closed that Friday (Good Friday, July 4th, Christmas, ...).
+"""
+from datetime import date, timedelta
+from functools import lru_cache
+
+import numpy as np
+
+FIRST_YEAR = 1980
+LAST_YEAR = 2060
+
+# Part of the strategy signatures stored with the backfill marks. Bump it
+# whenever expiration_sessions returns different dates, so incremental
+# backfills rebuild the stored trades. 1 was the plain next Friday.
+EXPIRATION_RULE = 2
+
+# Unscheduled full-day closures
+SPECIAL_CLOSURES = [
+    date(1985, 9, 27),  # Hurricane Gloria
+    date(1994, 4, 27),  # President Nixon's funeral
+    date(2001, 9, 11),  # September 11 attacks
+    date(2001, 9, 12),
+    date(2001, 9, 13),
+    date(2001, 9, 14),
+    date(2004, 6, 11),  # President Reagan's funeral
+    date(2007, 1, 2),  # President Ford's funeral
+    date(2012, 10, 29),  # Hurricane Sandy
+    date(2012, 10, 30),
+    date(2018, 12, 5),  # President George H. W. Bush's funeral
+    date(2025, 1, 9),  # President Carter's funeral
+]
+
+
+def easter(year):
+    """Easter Sunday, anonymous Gregorian algorithm"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def nth_weekday(year, month, weekday, n):
+    """n-th (1-based, -1 for the last) given weekday of a month, Monday is 0"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def observed(day):
+    """Saturday holidays are observed on Friday, Sunday holidays on Monday"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def holidays(year):
+    """Full-day NYSE holidays of a year"""
+    days = [
+        nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+        easter(year) - timedelta(days=2),  # Good Friday
+        nth_weekday(year, 5, 0, -1),  # Memorial Day
+        observed(date(year, 7, 4)),  # Independence Day
+        nth_weekday(year, 9, 0, 1),  # Labor Day
+        nth_weekday(year, 11, 3, 4),  # Thanksgiving
+        observed(date(year, 12, 25)),  # Christmas
+    ]
+    # A Saturday New Year's Day is not moved back into the previous year
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        days.append(observed(new_year))
+    if year >= 1998:
+        days.append(nth_weekday(year, 1, 0, 3))  # Martin Luther King Jr. Day
+    if year >= 2022:
+        days.append(observed(date(year, 6, 19)))  # Juneteenth
+    return days
+
+
+@lru_cache(maxsize=None)
+def calendar_table():
+    """
+    (first_day, is_session, expiration) arrays over every calendar day of
+    the covered years; expiration holds day offsets from first_day.
+    """
+    first_day = np.datetime64(date(FIRST_YEAR, 1, 1), "D")
+    days = np.arange(first_day, np.datetime64(date(LAST_YEAR + 1, 1, 1), "D"))
+    weekdays = _weekdays(days)
+
+    closed = [day for year in range(FIRST_YEAR, LAST_YEAR + 1) for day in holidays(year)]
+    closed += SPECIAL_CLOSURES
+    is_session = (weekdays < 5) & ~np.isin(days, np.array(closed, dtype="datetime64[D]"))
+
+    offsets = np.arange(len(days))
+    # Last session on or before every day (the first days are never before a session)
+    last_session = np.maximum.accumulate(np.where(is_session, offsets, 0))
+    fridays = np.minimum(offsets + (4 - weekdays) % 7, len(days) - 1)
+    return first_day, is_session, last_session[fridays]
+
+
+def _weekdays(dates):
+    return (dates.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+
+
+def _offsets(dates):
+    """Offsets of dates in the table, clipped to it, and whether each is inside"""
+    first_day, is_session, _ = calendar_table()
+    offsets = (dates - first_day).astype(np.int64)
+    inside = (offsets >= 0) & (offsets < len(is_session))
+    return np.clip(offsets, 0, len(is_session) - 1), inside
+
+
+def is_session(dates):
+    """
+    Whether each date is a trading session, for a scalar or an array.
+    Outside the covered years every weekday counts as a session.
+    """
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    offsets, inside = _offsets(dates)
+    return np.where(inside, calendar_table()[1][offsets], _weekdays(dates) < 5)[()]
+
+
+def expiration_sessions(dates, days_to_expiration):
+    """
+    Batch expiration lookup: the session on which an option alerted on each
+    date expires when it is rounded to the first Friday at least
+    days_to_expiration days later. Returns datetime64[D]. Outside the
+    covered years the option expires on that Friday, holidays unknown.
+    """
+    first_day, _, expiration = calendar_table()
+    target = np.asarray(dates, dtype="datetime64[D]") + np.timedelta64(days_to_expiration, "D")
+    fridays = target + (4 - _weekdays(target)) % 7
+    offsets, inside = _offsets(target)
+    # The Friday must be covered as well, the table stops at the end of LAST_YEAR
+    inside &= _offsets(fridays)[1]
+    return np.where(inside, first_day + expiration[offsets], fridays)[()]
+
+
+def expiration_session(alert_date, days_to_expiration):
+    """expiration_sessions for one date or datetime, returned as the same type"""
+    session = expiration_sessions(np.datetime64(alert_date, "D"), days_to_expiration)
+    offset = int((session - np.datetime64(alert_date, "D")).astype(np.int64))
+    return alert_date + timedelta(days=offset)
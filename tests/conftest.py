@@ -0,0 +1,26 @@
+"""
+The scripts are flat modules run from their own directory, so scriptsv2 is
+put on the path and the same-named v1 modules are loaded from their files.
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "scriptsv2"))
+
+def load_v1(name):
+    """Module name of scripts/, imported under v1_<name>"""
+    spec = importlib.util.spec_from_file_location(f"v1_{name}", os.path.join(ROOT, "scripts", f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    # Never read or write the real price cache
+    monkeypatch.setenv("PRICE_CACHE_DIR", str(tmp_path / "prices"))
+    monkeypatch.delenv("PRICE_CACHE_OFFLINE", raising=False)
+    monkeypatch.delenv("PRICE_SOURCE_URL", raising=False)
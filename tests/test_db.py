@@ -0,0 +1,68 @@
+import sqlite3
+from datetime import date
+
+import pytest
+
+import db
+from strategy import Trade
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    db.close_connection()
+    monkeypatch.setattr(db, "DB_NAME", str(tmp_path / "trades.db"))
+    yield db.DB_NAME
+    db.close_connection()
+
+@pytest.fixture
+def conn(db_path):
+    return db.create_connection()
+
+def trade(status=None):
+    return Trade("SPY", "Trend Up", 500.0, date(2024, 1, 2), date(2024, 1, 12), "put", 490.0, status)
+
+def stored_statuses(conn):
+    return [row[0] for row in conn.execute("SELECT status FROM trades")]
+
+def test_backfill_settles_a_trade_stored_without_status(conn):
+    # main.py run stores its alerts unsettled
+    assert db.save_trades([trade()]) == 1
+    assert stored_statuses(conn) == [None]
+
+    assert db.save_trades([trade("win")]) == 1
+    assert stored_statuses(conn) == ["win"]
+
+def test_settled_trades_are_not_overwritten(conn):
+    db.save_trades([trade("win")])
+    assert db.save_trades([trade("loss"), trade()]) == 0
+    assert not db.save_trade_to_db(trade(), None)
+    assert stored_statuses(conn) == ["win"]
+
+def old_database(path):
+    """Database at schema version 1 holding two alerts of the same contract"""
+    conn = sqlite3.connect(path)
+    for statement in db.MIGRATIONS[0]:
+        conn.execute(statement)
+    conn.execute("PRAGMA user_version = 1")
+    for date_alerted in ("2024-01-02", "2024-01-04"):
+        conn.execute("""
+            INSERT INTO trades (ticker, strategy_name, current_price, date_alerted,
+                                expiration_date, option_type, strike_price, status)
+            VALUES ('SPY', 'Trend Up', 500.0, ?, '2024-01-12', 'put', 490.0, 'win')
+        """, (date_alerted,))
+    conn.commit()
+    return conn
+
+def test_migration_refuses_to_delete_duplicate_trades(db_path):
+    old_database(db_path).close()
+    with pytest.raises(db.MigrationError, match="SPY Trend Up 2024-01-12 put 490.0"):
+        db.create_connection()
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM trades").fetchone()[0] == 2
+
+def test_duplicate_trades_are_moved_on_request(db_path):
+    conn = old_database(db_path)
+    assert db.migrate(conn, move_duplicates=True) == len(db.MIGRATIONS)
+    assert conn.execute("SELECT date_alerted FROM trades").fetchall() == [("2024-01-02",)]
+    assert conn.execute("SELECT date_alerted FROM trades_duplicates").fetchall() == [("2024-01-04",)]
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+import notifier
+from conftest import load_v1
+from fake_telegram import start_server
+
+@pytest.fixture(params=["v1", "v2"])
+def module(request):
+    return load_v1("notifier") if request.param == "v1" else notifier
+
+def make_notifier(module, server, **options):
+    client = module.TelegramClient("TOKEN", "42", api_url=server.url)
+    return module.Notifier(client, rate=0, backoff=0.01, **options)
+
+def texts(server):
+    return [message["text"] for message in server.messages]
+
+def test_alerts_of_a_run_are_sent_together_on_flush(module):
+    server = start_server()
+    with make_notifier(module, server) as sender:
+        for ticker in ["SPY", "QQQ", "IWM"]:
+            sender.send(f"{ticker} alert")
+            time.sleep(0.1)
+        # Nothing leaves before the flush, however far apart the alerts were queued
+        assert server.messages == []
+        assert sender.flush(timeout=5)
+
+        assert texts(server) == ["SPY alert\n\nQQQ alert\n\nIWM alert"]
+        assert server.messages[0]["chat_id"] == "42"
+
+        sender.send("VTI alert")
+    # close() sends the rest as the next batch
+    assert texts(server) == ["SPY alert\n\nQQQ alert\n\nIWM alert", "VTI alert"]
+    server.shutdown()
+
+def test_parts_of_a_long_batch_arrive_in_order(module):
+    server = start_server(delay=0.01)
+    messages = [f"alert {number:02d}\n" + "x" * 20 for number in range(30)]
+    with make_notifier(module, server, max_length=70) as sender:
+        for message in messages:
+            sender.send(message)
+        assert sender.flush(timeout=10)
+
+    assert texts(server) == module.coalesce(messages, 70)
+    assert len(server.messages) > 10
+    server.shutdown()
+
+@pytest.mark.parametrize("error", [429, 500, 503])
+def test_rate_limit_and_server_errors_are_retried(module, error):
+    server = start_server(fail=2, error=error, retry_after=0)
+    with make_notifier(module, server) as sender:
+        sender.send("SPY alert")
+        assert sender.flush(timeout=5)
+
+    assert texts(server) == ["SPY alert"]
+    assert server.requests == 3
+    assert (sender.sent, sender.failed) == (1, 0)
+    server.shutdown()
+
+def test_message_is_dropped_after_the_last_retry(module, capsys):
+    server = start_server(fail=10, error=500)
+    with make_notifier(module, server, retries=2) as sender:
+        sender.send("SPY alert")
+        sender.send("QQQ alert")
+        assert sender.flush(timeout=5)
+
+    assert server.messages == []
+    assert server.requests == 3
+    assert (sender.sent, sender.failed) == (0, 1)
+    assert "Telegram message not sent: HTTP 500" in capsys.readouterr().out
+    server.shutdown()
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import price_cache
+from pipeline import run_pipeline
+from price_server import start_server
+
+def bars(closes, start="2024-01-01"):
+    index = pd.bdate_range(start, periods=len(closes), name="Date")
+    closes = np.asarray(closes, dtype=float)
+    return pd.DataFrame({"Open": closes, "Close": closes, "Volume": np.ones(len(closes))}, index=index)
+
+def last_close(ticker, history):
+    return len(history), history["Close"].iloc[-1]
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    """price_server over its own directory, with the client cache left empty"""
+    source_dir = tmp_path / "source"
+    price_cache.write_cache("SPY", bars(np.arange(100.0, 130.0)), str(source_dir))
+    price_cache.write_cache("QQQ", bars(np.arange(200.0, 220.0)), str(source_dir))
+    server = start_server(str(source_dir))
+    monkeypatch.setenv("PRICE_SOURCE_URL", server.url)
+    yield server
+    server.shutdown()
+
+@pytest.mark.parametrize("compute_workers", [1, 2])
+def test_pipeline_downloads_and_processes_every_ticker(source, compute_workers, capsys):
+    results = dict(run_pipeline(["SPY", "MISSING", "QQQ"], last_close, compute_workers=compute_workers))
+
+    assert results == {"SPY": (30, 129.0), "QQQ": (20, 219.0)}
+    assert "Failed to download MISSING" in capsys.readouterr().out
+    # The downloads went through the cache
+    np.testing.assert_array_equal(price_cache.read_cache("SPY")["Close"], np.arange(100.0, 130.0))
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import price_cache
+from conftest import load_v1
+
+def bars(closes, start="2024-01-01"):
+    index = pd.bdate_range(start, periods=len(closes), name="Date")
+    closes = np.asarray(closes, dtype=float)
+    return pd.DataFrame({"Open": closes, "Close": closes, "Volume": np.ones(len(closes))}, index=index)
+
+class Source:
+    """download_history over a full history, recording the start of every request"""
+
+    def __init__(self, history):
+        self.history = history
+        self.starts = []
+
+    def __call__(self, ticker, start=None):
+        self.starts.append(start)
+        return self.history if start is None else self.history[self.history.index >= start]
+
+@pytest.fixture(params=["v1", "v2"])
+def cache(request, monkeypatch, tmp_path):
+    module = load_v1("price_cache") if request.param == "v1" else price_cache
+    source = Source(bars(np.arange(100.0, 110.0)))
+    monkeypatch.setattr(module, "download_history", source)
+    module.load_history("SPY")
+    return module, source
+
+def test_new_bars_are_appended_on_the_same_basis(cache):
+    module, source = cache
+    source.history = bars(np.arange(100.0, 112.0))
+
+    history = module.load_history("SPY")
+    np.testing.assert_array_equal(history["Close"], np.arange(100.0, 112.0))
+    # Only the bars from the last complete cached one on were downloaded
+    assert source.starts[-1] == "2024-01-11"
+    np.testing.assert_array_equal(module.read_cache("SPY")["Close"], history["Close"])
+
+def test_adjusted_history_is_reloaded(cache):
+    module, source = cache
+    # A dividend scales every earlier bar
+    source.history = bars(np.arange(100.0, 112.0) * 0.98)
+
+    history = module.load_history("SPY")
+    np.testing.assert_allclose(history["Close"], np.arange(100.0, 112.0) * 0.98)
+    assert source.starts[-2:] == ["2024-01-11", None]
+    np.testing.assert_allclose(module.read_cache("SPY")["Close"], history["Close"])
+
+def test_intraday_last_bar_is_replaced_without_reload(cache):
+    module, source = cache
+    closes = np.arange(100.0, 110.0)
+    closes[-1] = 111.5
+    source.history = bars(closes)
+
+    history = module.load_history("SPY")
+    assert history["Close"].iloc[-1] == 111.5
+    assert None not in source.starts[1:]
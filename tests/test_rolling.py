@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from rolling import RollingStats
+from strategy import TickerData
+
+WINDOW = 200
+
+@pytest.fixture
+def history():
+    """1500 closes, past a REFRESH_INTERVAL, with NaN gaps of one and of several bars"""
+    rng = np.random.default_rng(7)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0.0004, 0.011, 1500)))
+    closes[[300, 640]] = np.nan
+    closes[1100:1104] = np.nan
+    index = pd.bdate_range("2018-01-01", periods=len(closes), name="Date")
+    return pd.DataFrame({"Close": closes}, index=index)
+
+def assert_matches_pandas(rolling, history):
+    expected = history["Close"].rolling(WINDOW)
+    np.testing.assert_array_equal(rolling.dates, history.index.values.astype("datetime64[D]"))
+    np.testing.assert_allclose(rolling.ma, expected.mean(), rtol=1e-9)
+    np.testing.assert_allclose(rolling.std, expected.std(), rtol=1e-9)
+
+def append_with_replacements(rolling, history):
+    """Append every bar, each one first with an intraday close that the final one replaces"""
+    for date, close in zip(history.index.values, history["Close"]):
+        rolling.append(date, close * 1.01)
+        rolling.append(date, close)
+
+def test_appended_bars_match_pandas(history):
+    rolling = RollingStats(WINDOW)
+    append_with_replacements(rolling, history)
+    assert_matches_pandas(rolling, history)
+
+def test_saved_state_resumes_like_pandas(history, tmp_path):
+    path = str(tmp_path / "SPY.rolling.npz")
+    RollingStats.from_closes(history.index.values[:700], history["Close"][:700], WINDOW).save(path)
+
+    rolling = RollingStats.load(path)
+    append_with_replacements(rolling, history[700:])
+    assert_matches_pandas(rolling, history)
+
+def test_ticker_data_resumes_from_a_saved_state(history, tmp_path):
+    path = str(tmp_path / "SPY.rolling.npz")
+    RollingStats.from_closes(history.index.values[:1050], history["Close"][:1050], WINDOW).save(path)
+
+    saved = RollingStats.load(path)
+    ticker_data = TickerData("SPY", history, rolling=saved)
+    assert ticker_data.rolling is saved
+    assert_matches_pandas(ticker_data.rolling, history)
+
+def test_state_of_another_window_is_recomputed(history):
+    saved = RollingStats.from_closes(history.index.values[:700], history["Close"][:700], 50)
+
+    ticker_data = TickerData("SPY", history, rolling=saved)
+    assert ticker_data.rolling is not saved
+    assert ticker_data.rolling.window == WINDOW
+    assert_matches_pandas(ticker_data.rolling, history)
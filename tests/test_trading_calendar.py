@@ -0,0 +1,28 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+import trading_calendar
+from conftest import load_v1
+
+@pytest.fixture(params=["v1", "v2"])
+def calendar(request):
+    return load_v1("trading_calendar") if request.param == "v1" else trading_calendar
+
+def test_holiday_friday_expires_the_session_before(calendar):
+    # 2024-03-29 was Good Friday
+    assert calendar.expiration_session(date(2024, 3, 25), 4) == date(2024, 3, 28)
+    assert not calendar.is_session(np.datetime64("2024-03-29"))
+
+def test_dates_outside_the_table_fall_back_to_fridays(calendar):
+    dates = np.array(["1962-01-02", "1979-12-28", "2060-12-29"], dtype="datetime64[D]")
+    expected = np.array(["1962-01-12", "1980-01-04", "2061-01-07"], dtype="datetime64[D]")
+    np.testing.assert_array_equal(calendar.expiration_sessions(dates, 6), expected)
+    assert calendar.expiration_session(date(1950, 6, 5), 6) == date(1950, 6, 16)
+
+def test_weekdays_are_sessions_outside_the_table(calendar):
+    assert calendar.is_session(np.datetime64("1975-01-03"))
+    assert not calendar.is_session(np.datetime64("1975-01-04"))
+    np.testing.assert_array_equal(
+        calendar.is_session(np.array(["1975-01-03", "2024-07-04"], dtype="datetime64[D]")), [True, False])